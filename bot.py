@@ -26,6 +26,7 @@ except ImportError:
     from config import FB_VERIFY_TOKEN, BREVO_API_KEY, FROM_EMAIL, ADMIN_EMAIL_NOTIFICATIONS, AI_CONFIG, PAGE_CONFIG, DB_PATH
 from database import DatabaseTable
 import database  # Import modułu, aby nadpisać DB_PATH
+from database_backup import schedule_backups
 import logging
 from datetime import datetime, timedelta
 import pytz
@@ -57,7 +58,7 @@ database.DB_PATH = DB_PATH
 
 # Inicjalizacja bazy danych SQLite (zastąpienie Airtable)
 try:
-    clients_table = DatabaseTable('Klienci')
+    clients_table = DatabaseTable('Klienci', cache=True)
     print("--- Połączenie z bazą danych SQLite OK.")
 except Exception as e:
     print(f"!!! BŁĄD: Nie można połączyć się z bazą danych: {e}")
@@ -303,7 +304,8 @@ def create_or_find_client_in_airtable(psid, page_access_token, clients_table_obj
             "NazwiskoKlienta": last_name if last_name else "dane"
         }
             
-        clients_table_obj.create(new_client_data)
+        # upsert zamiast create: dwa wątki webhooka z tym samym PSID nie zderzą się na UNIQUE(ClientID)
+        clients_table_obj.upsert("ClientID", new_client_data, on_conflict='ignore')
         return psid
     except Exception as e:
         logging.error(f"Błąd bazy danych: {e}")
@@ -882,6 +884,7 @@ if __name__ == '__main__':
 
     scheduler = BackgroundScheduler(timezone=TIMEZONE)
     scheduler.add_job(func=check_and_send_nudges, trigger="interval", seconds=30)
+    schedule_backups(scheduler)  # Codzienna kopia baz w trakcie pracy (database_backup.py)
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
 
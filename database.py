@@ -1,131 +1,616 @@
 import sys
 import os
 import json
-import re
-from typing import Optional, List, Dict, Any
+import queue
+import atexit
+import logging
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from typing import Optional, List, Dict, Any, Iterator, Tuple, Set
 
 # Dodaj katalog nadrzędny do sys.path, aby można było zaimportować config.py
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from config import DB_PATH
+from database_formula import compile_formula, local_timestamp, LOCAL_TIMEZONE
+from database_migrations import apply_migrations, add_column
+from database_pragmas import apply_profile
 
 import sqlite3
 
-def get_connection():
-    """Zwraca połączenie z bazą danych."""
-    conn = sqlite3.connect(DB_PATH, timeout=20) # Zwiększony timeout do 20 sekund
-    conn.execute("PRAGMA journal_mode=WAL") # Włączenie trybu WAL dla lepszej współbieżności
+logger = logging.getLogger(__name__)
+
+# Maksymalna liczba bezczynnych połączeń trzymanych w puli (na plik bazy)
+POOL_SIZE = 8
+
+# Maksymalna liczba parametrów w jednym "WHERE id IN (...)" przy operacjach wsadowych
+BATCH_CHUNK_SIZE = 500
+
+# Domyślny rozmiar strony dla DatabaseTable.iterate()
+ITERATE_PAGE_SIZE = 500
+
+# Zapisy DatabaseTable przez jeden wątek zapisujący (DatabaseWriter) zamiast bezpośrednio z puli
+SERIALIZED_WRITES = os.environ.get('DB_SERIALIZED_WRITES') == '1'
+
+# Group commit / write-behind (DatabaseTable(..., write_behind=True)):
+# zapisy są zbierane najwyżej WRITE_BEHIND_MAX_DELAY sekund albo do WRITE_BEHIND_MAX_OPS operacji
+# i zatwierdzane jedną transakcją. Przy wyjściu z procesu kolejka jest domyślnie dopisywana do bazy.
+WRITE_BEHIND_MAX_DELAY = float(os.environ.get('DB_WRITE_BEHIND_MAX_DELAY', '0.005'))
+WRITE_BEHIND_MAX_OPS = int(os.environ.get('DB_WRITE_BEHIND_MAX_OPS', '256'))
+WRITE_BEHIND_FLUSH_ON_EXIT = os.environ.get('DB_WRITE_BEHIND_FLUSH_ON_EXIT', '1') == '1'
+
+# Domyślne parametry cache rekordów (DatabaseTable(..., cache=True))
+RECORD_CACHE_SIZE = 1024
+RECORD_CACHE_TTL = 30.0 # sekundy
+
+# Tryb debugowania: loguje EXPLAIN QUERY PLAN dla każdego zapytania DatabaseTable
+EXPLAIN_QUERY_PLAN = os.environ.get('DB_EXPLAIN_QUERY_PLAN') == '1'
+
+# Kolumny dostępności korepetytora w kolejności datetime.weekday() (0 = poniedziałek)
+WEEKDAY_COLUMNS = ['Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela']
+
+def _minutes_sql(expr: str) -> str:
+    """Wyrażenie SQL zamieniające tekst 'H:MM' na minuty od północy."""
+    return (f"(CAST(substr({expr}, 1, instr({expr}, ':') - 1) AS INTEGER) * 60"
+            f" + CAST(substr({expr}, instr({expr}, ':') + 1) AS INTEGER))")
+
+def _tutor_availability_insert_sql(source: str, from_clause: str = '') -> str:
+    """
+    INSERT rozwijający kolumny dni wiersza Korepetytorzy (source = alias tabeli lub NEW)
+    na przedziały TutorAvailability w minutach. Wpis '14:00-20:00' to przedział,
+    pojedyncza godzina '8:00' to jedna 60-minutowa lekcja. Wartości niebędące JSON-em
+    (stary format) są traktowane jak lista jednoelementowa.
+    """
+    day_value = 'CASE d.dzien ' + ' '.join(
+        f'WHEN {index} THEN {source}."{column}"' for index, column in enumerate(WEEKDAY_COLUMNS)
+    ) + ' END'
+    days = ' UNION ALL '.join(f'SELECT {index} AS dzien' for index in range(len(WEEKDAY_COLUMNS)))
+    start, end = _minutes_sql('poczatek'), _minutes_sql('koniec')
+    return f"""
+        INSERT INTO TutorAvailability (TutorID, DzienTygodnia, Od, Do)
+        SELECT TutorID, dzien, {start}, CASE WHEN koniec IS NULL THEN {start} + 60 ELSE {end} END
+        FROM (
+            SELECT TutorID, dzien,
+                   trim(CASE WHEN instr(v, '-') > 0 THEN substr(v, 1, instr(v, '-') - 1) ELSE v END) AS poczatek,
+                   CASE WHEN instr(v, '-') > 0 THEN trim(substr(v, instr(v, '-') + 1)) END AS koniec
+            FROM (
+                SELECT {source}.TutorID AS TutorID, d.dzien AS dzien, trim(j.value) AS v
+                FROM {from_clause} ({days}) d,
+                     json_each(CASE WHEN json_valid({day_value}) THEN {day_value} ELSE json_array({day_value}) END) j
+                WHERE {day_value} IS NOT NULL AND {day_value} != '' AND j.type = 'text'
+            )
+        )
+        WHERE instr(poczatek, ':') > 0 AND (koniec IS NULL OR instr(koniec, ':') > 0)
+    """
+
+_AVAILABILITY_COLUMNS = ', '.join(['TutorID'] + [f'"{column}"' for column in WEEKDAY_COLUMNS])
+
+# Wersjonowane migracje schematu: (wersja, [polecenia SQL]). Bieżąca wersja jest w PRAGMA user_version.
+# Tabele podstawowe - tworzone przez migrację 1 (starsze bazy już je mają, stąd IF NOT EXISTS)
+BASE_TABLES = [
+    # Tabela Klienci
+    '''
+    CREATE TABLE IF NOT EXISTS Klienci (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ClientID TEXT UNIQUE NOT NULL,
+        Imie TEXT,
+        Nazwisko TEXT,
+        LINK TEXT,
+        ImieKlienta TEXT,
+        NazwiskoKlienta TEXT,
+        Zdjecie TEXT,
+        wolna_kwota INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Tabela Korepetytorzy
+    '''
+    CREATE TABLE IF NOT EXISTS Korepetytorzy (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        TutorID TEXT UNIQUE NOT NULL,
+        ImieNazwisko TEXT NOT NULL,
+        Poniedziałek TEXT,
+        Wtorek TEXT,
+        Środa TEXT,
+        Czwartek TEXT,
+        Piątek TEXT,
+        Sobota TEXT,
+        Niedziela TEXT,
+        Przedmioty TEXT,
+        PoziomNauczania TEXT,
+        LINK TEXT,
+        LimitGodzinTygodniowo INTEGER DEFAULT NULL,
+        Email TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Tabela Rezerwacje
+    '''
+    CREATE TABLE IF NOT EXISTS Rezerwacje (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Klient TEXT NOT NULL,
+        Korepetytor TEXT NOT NULL,
+        Data TEXT NOT NULL,
+        Godzina TEXT NOT NULL,
+        Przedmiot TEXT,
+        Status TEXT DEFAULT 'Oczekuje na płatność',
+        Typ TEXT DEFAULT 'Jednorazowa',
+        ManagementToken TEXT UNIQUE,
+        TeamsLink TEXT,
+        JestTestowa INTEGER DEFAULT 0,
+        Oplacona INTEGER DEFAULT 0,
+        confirmed INTEGER DEFAULT 0,
+        TypSzkoly TEXT,
+        Poziom TEXT,
+        Klasa TEXT,
+        WolnaKwotaUzyta INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (Klient) REFERENCES Klienci(ClientID)
+    )
+    ''',
+    # Tabela StaleRezerwacje
+    '''
+    CREATE TABLE IF NOT EXISTS StaleRezerwacje (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Klient_ID TEXT NOT NULL,
+        Korepetytor TEXT NOT NULL,
+        DzienTygodnia TEXT NOT NULL,
+        Godzina TEXT NOT NULL,
+        Przedmiot TEXT,
+        Aktywna INTEGER DEFAULT 1,
+        TypSzkoly TEXT,
+        Poziom TEXT,
+        Klasa TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (Klient_ID) REFERENCES Klienci(ClientID)
+    )
+    ''',
+]
+
+# Kolumny Rezerwacje przenoszone do archiwum; jawna lista, bo w starszych bazach kolejność kolumn bywa inna
+RESERVATION_COLUMNS = [
+    'id', 'Klient', 'Korepetytor', 'Data', 'Godzina', 'Przedmiot', 'Status', 'Typ', 'ManagementToken',
+    'TeamsLink', 'JestTestowa', 'Oplacona', 'confirmed', 'TypSzkoly', 'Poziom', 'Klasa', 'WolnaKwotaUzyta',
+    'created_at',
+]
+RESERVATION_ARCHIVE_TABLE = 'RezerwacjeArchiwum'
+# Widok tylko do odczytu: DatabaseTable(RESERVATION_HISTORY_VIEW).all(...) dla zapytań historycznych
+RESERVATION_HISTORY_VIEW = 'RezerwacjeWszystkie'
+
+# Początek lekcji jako czas uniksowy (Europe/Warsaw) - indeksowana kolumna dla zapytań o zakres czasu
+START_TS_COLUMN = 'start_ts'
+START_TS_TABLES = frozenset(['Rezerwacje', RESERVATION_ARCHIVE_TABLE, RESERVATION_HISTORY_VIEW])
+
+# Funkcje SQL rejestrowane na każdym połączeniu: nazwa -> (liczba argumentów, funkcja)
+SQL_FUNCTIONS = {
+    'local_timestamp': (2, local_timestamp),
+}
+
+# Kolumny wyliczane przy zapisie przez DatabaseTable: tabela -> {kolumna: (kolumny źródłowe, funkcja SQL)}
+DERIVED_COLUMNS = {
+    'Rezerwacje': {START_TS_COLUMN: (('Data', 'Godzina'), 'local_timestamp')},
+    RESERVATION_ARCHIVE_TABLE: {START_TS_COLUMN: (('Data', 'Godzina'), 'local_timestamp')},
+}
+
+def _table_version_triggers(table: str) -> List[str]:
+    """Triggery podbijające licznik TableVersions tabeli przy każdym zapisie (także z innych procesów)."""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_version_{action.lower()} AFTER {action} ON {table}
+        BEGIN
+            UPDATE TableVersions SET version = version + 1 WHERE name = '{table}';
+        END"""
+        for action in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+# Migracje schematu: (wersja, [kroki]) - wykonywane przez database_migrations.apply_migrations
+SCHEMA_MIGRATIONS = [
+    (1, BASE_TABLES + [
+        # Kolumny dodane po pierwszym wdrożeniu (bazy sprzed wersjonowania mogą ich nie mieć)
+        add_column('Korepetytorzy', 'Email', 'TEXT'),
+        add_column('Korepetytorzy', 'LimitGodzinTygodniowo', 'INTEGER'),
+        add_column('Rezerwacje', 'WolnaKwotaUzyta', 'INTEGER'),
+        add_column('Rezerwacje', 'confirmed', 'INTEGER'),
+        # Sprawdzanie zajętości terminu korepetytora
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_termin ON Rezerwacje(Korepetytor, Data, Godzina)",
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_klient ON Rezerwacje(Klient)",
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_status ON Rezerwacje(Status)",
+        "CREATE INDEX IF NOT EXISTS idx_stale_rezerwacje_termin ON StaleRezerwacje(Korepetytor, DzienTygodnia, Aktywna)",
+        # Częściowy, pokrywający indeks tylko dla aktywnych stałych rezerwacji (warunek musi zawierać Aktywna = 1)
+        "CREATE INDEX IF NOT EXISTS idx_stale_rezerwacje_aktywne ON StaleRezerwacje(Korepetytor, DzienTygodnia, Godzina) WHERE Aktywna = 1",
+    ]),
+    (2, [
+        # Znormalizowana dostępność: jeden wiersz na przedział (minuty od północy) w danym dniu tygodnia.
+        # Utrzymywana przez triggery, więc jest zgodna z kolumnami dni niezależnie od tego, kto zapisuje.
+        """CREATE TABLE IF NOT EXISTS TutorAvailability (
+            TutorID TEXT NOT NULL,
+            DzienTygodnia INTEGER NOT NULL,
+            Od INTEGER NOT NULL,
+            Do INTEGER NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_tutor_availability_slot ON TutorAvailability(DzienTygodnia, Od, Do, TutorID)",
+        "CREATE INDEX IF NOT EXISTS idx_tutor_availability_tutor ON TutorAvailability(TutorID)",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_korepetytorzy_availability_insert AFTER INSERT ON Korepetytorzy
+        BEGIN
+            {_tutor_availability_insert_sql('NEW')};
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_korepetytorzy_availability_update
+        AFTER UPDATE OF {_AVAILABILITY_COLUMNS} ON Korepetytorzy
+        BEGIN
+            DELETE FROM TutorAvailability WHERE TutorID = OLD.TutorID;
+            {_tutor_availability_insert_sql('NEW')};
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_korepetytorzy_availability_delete AFTER DELETE ON Korepetytorzy
+        BEGIN
+            DELETE FROM TutorAvailability WHERE TutorID = OLD.TutorID;
+        END""",
+        "DELETE FROM TutorAvailability",
+        _tutor_availability_insert_sql('k', 'Korepetytorzy k,'),
+    ]),
+    (3, [
+        # Ładowanie całego tygodnia rezerwacji (wszyscy korepetytorzy) - indeks pokrywający po dacie
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_data ON Rezerwacje(Data, Korepetytor, Godzina, Status)",
+    ]),
+    (4, [
+        # Limit godzin tygodniowo: liczenie rezerwacji korepetytora w tygodniu bez sięgania do tabeli
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_tydzien ON Rezerwacje(Korepetytor, Data, Status)",
+        # Rezerwacje wskazują korepetytora po ImieNazwisko
+        "CREATE INDEX IF NOT EXISTS idx_korepetytorzy_imie_nazwisko ON Korepetytorzy(ImieNazwisko)",
+    ]),
+    (5, [
+        # Strony płatności i zarządzania: token -> (id, Status, Oplacona) z samego indeksu
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_token_status ON Rezerwacje(ManagementToken, Status, Oplacona)",
+        "CREATE INDEX IF NOT EXISTS idx_rezerwacje_teams_link ON Rezerwacje(TeamsLink)",
+    ]),
+    (6, [
+        # Archiwum starych rezerwacji (database_archive.py) - te same kolumny, id zachowane z tabeli głównej
+        f"""CREATE TABLE IF NOT EXISTS {RESERVATION_ARCHIVE_TABLE} (
+            id INTEGER PRIMARY KEY,
+            Klient TEXT NOT NULL,
+            Korepetytor TEXT NOT NULL,
+            Data TEXT NOT NULL,
+            Godzina TEXT NOT NULL,
+            Przedmiot TEXT,
+            Status TEXT,
+            Typ TEXT,
+            ManagementToken TEXT,
+            TeamsLink TEXT,
+            JestTestowa INTEGER DEFAULT 0,
+            Oplacona INTEGER DEFAULT 0,
+            confirmed INTEGER DEFAULT 0,
+            TypSzkoly TEXT,
+            Poziom TEXT,
+            Klasa TEXT,
+            WolnaKwotaUzyta INTEGER DEFAULT 0,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_archiwum_termin ON {RESERVATION_ARCHIVE_TABLE}(Korepetytor, Data, Godzina)",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_archiwum_data ON {RESERVATION_ARCHIVE_TABLE}(Data)",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_archiwum_klient ON {RESERVATION_ARCHIVE_TABLE}(Klient)",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_archiwum_token ON {RESERVATION_ARCHIVE_TABLE}(ManagementToken)",
+        # Widok dla zapytań historycznych: rezerwacje bieżące i zarchiwizowane razem
+        f"""CREATE VIEW IF NOT EXISTS {RESERVATION_HISTORY_VIEW} AS
+            SELECT {', '.join(RESERVATION_COLUMNS)} FROM Rezerwacje
+            UNION ALL
+            SELECT {', '.join(RESERVATION_COLUMNS)} FROM {RESERVATION_ARCHIVE_TABLE}""",
+    ]),
+    (7, [
+        # Liczniki wersji tabel - zmieniane triggerami przy każdym zapisie, także z innych procesów.
+        # Migawki w pamięci (np. TutorSnapshot) porównują licznik zamiast przeładowywać tabelę.
+        """CREATE TABLE IF NOT EXISTS TableVersions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""",
+        "INSERT OR IGNORE INTO TableVersions (name, version) VALUES ('Korepetytorzy', 0)",
+    ] + _table_version_triggers('Korepetytorzy')),
+    (8, [
+        # Początek lekcji jako liczba: "nadchodzące lekcje" i zakresy dat/godzin po indeksie
+        # (Godzina 'H:MM' jako tekst nie sortuje się poprawnie). Utrzymywany przez DatabaseTable.
+        add_column('Rezerwacje', START_TS_COLUMN, 'INTEGER'),
+        add_column(RESERVATION_ARCHIVE_TABLE, START_TS_COLUMN, 'INTEGER'),
+        f"UPDATE Rezerwacje SET {START_TS_COLUMN} = local_timestamp(Data, Godzina)",
+        f"UPDATE {RESERVATION_ARCHIVE_TABLE} SET {START_TS_COLUMN} = local_timestamp(Data, Godzina)",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_start ON Rezerwacje({START_TS_COLUMN})",
+        f"CREATE INDEX IF NOT EXISTS idx_rezerwacje_archiwum_start ON {RESERVATION_ARCHIVE_TABLE}({START_TS_COLUMN})",
+        f"DROP VIEW IF EXISTS {RESERVATION_HISTORY_VIEW}",
+        f"""CREATE VIEW {RESERVATION_HISTORY_VIEW} AS
+            SELECT {', '.join(RESERVATION_COLUMNS + [START_TS_COLUMN])} FROM Rezerwacje
+            UNION ALL
+            SELECT {', '.join(RESERVATION_COLUMNS + [START_TS_COLUMN])} FROM {RESERVATION_ARCHIVE_TABLE}""",
+    ]),
+    (9, [
+        # Liczniki wersji rezerwacji: silnik terminów i ekspander stałych rezerwacji
+        # (database_availability) widzą zapisy z innych procesów, np. backendu
+        "INSERT OR IGNORE INTO TableVersions (name, version) VALUES ('Rezerwacje', 0), ('StaleRezerwacje', 0)",
+    ] + _table_version_triggers('Rezerwacje') + _table_version_triggers('StaleRezerwacje')),
+    (10, [
+        # Licznik Klienci dla RecordCache (DatabaseTable('Klienci', cache=True) w bot.py):
+        # cache czyści się tylko po zapisie tej tabeli spoza słuchaczy tego procesu
+        "INSERT OR IGNORE INTO TableVersions (name, version) VALUES ('Klienci', 0)",
+    ] + _table_version_triggers('Klienci')),
+]
+
+def _configure_connection(conn):
+    """Ustawia PRAGMA profilu wydajności (database_pragmas, w tym WAL), funkcje SQL i row_factory - raz na połączenie."""
+    apply_profile(conn)
+    for name, (arity, function) in SQL_FUNCTIONS.items():
+        conn.create_function(name, arity, function, deterministic=True)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_database():
-    """Inicjalizuje bazę danych z wszystkimi tabelami."""
-    conn = get_connection()
-    try:
-        cursor = conn.cursor()
-        
-        # Tabela Klienci
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Klienci (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ClientID TEXT UNIQUE NOT NULL,
-                Imie TEXT,
-                Nazwisko TEXT,
-                LINK TEXT,
-                ImieKlienta TEXT,
-                NazwiskoKlienta TEXT,
-                Zdjecie TEXT,
-                wolna_kwota INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Tabela Korepetytorzy
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Korepetytorzy (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                TutorID TEXT UNIQUE NOT NULL,
-                ImieNazwisko TEXT NOT NULL,
-                Poniedziałek TEXT,
-                Wtorek TEXT,
-                Środa TEXT,
-                Czwartek TEXT,
-                Piątek TEXT,
-                Sobota TEXT,
-                Niedziela TEXT,
-                Przedmioty TEXT,
-                PoziomNauczania TEXT,
-                LINK TEXT,
-                LimitGodzinTygodniowo INTEGER DEFAULT NULL,
-                Email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabela Rezerwacje
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Rezerwacje (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                Klient TEXT NOT NULL,
-                Korepetytor TEXT NOT NULL,
-                Data TEXT NOT NULL,
-                Godzina TEXT NOT NULL,
-                Przedmiot TEXT,
-                Status TEXT DEFAULT 'Oczekuje na płatność',
-                Typ TEXT DEFAULT 'Jednorazowa',
-                ManagementToken TEXT UNIQUE,
-                TeamsLink TEXT,
-                JestTestowa INTEGER DEFAULT 0,
-                Oplacona INTEGER DEFAULT 0,
-                confirmed INTEGER DEFAULT 0,
-                TypSzkoly TEXT,
-                Poziom TEXT,
-                Klasa TEXT,
-                WolnaKwotaUzyta INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (Klient) REFERENCES Klienci(ClientID)
-            )
-        ''')
-        
-        # Tabela StaleRezerwacje
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS StaleRezerwacje (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                Klient_ID TEXT NOT NULL,
-                Korepetytor TEXT NOT NULL,
-                DzienTygodnia TEXT NOT NULL,
-                Godzina TEXT NOT NULL,
-                Przedmiot TEXT,
-                Aktywna INTEGER DEFAULT 1,
-                TypSzkoly TEXT,
-                Poziom TEXT,
-                Klasa TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (Klient_ID) REFERENCES Klienci(ClientID)
-            )
-        ''')
-        
-        # Migracje kolumn (dla pewności)
-        tables_cols = {
-            'Korepetytorzy': ['Email', 'LimitGodzinTygodniowo'],
-            'Rezerwacje': ['WolnaKwotaUzyta', 'confirmed']
-        }
-        
-        for table, columns in tables_cols.items():
-            for col in columns:
-                try:
-                    cursor.execute(f"SELECT {col} FROM {table} LIMIT 1")
-                except sqlite3.OperationalError:
-                    print(f"Migracja: Dodawanie kolumny {col} do tabeli {table}...")
-                    col_type = "INTEGER" if col in ['LimitGodzinTygodniowo', 'WolnaKwotaUzyta', 'confirmed'] else "TEXT"
-                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}")
+def get_connection():
+    """Zwraca nowe połączenie z bazą danych (wywołujący sam je zamyka)."""
+    conn = sqlite3.connect(DB_PATH, timeout=20) # Zwiększony timeout do 20 sekund
+    return _configure_connection(conn)
+
+class ConnectionPool:
+    """
+    Ograniczona pula połączeń do jednego pliku bazy.
+    Połączenia są konfigurowane raz przy tworzeniu, a potem wypożyczane
+    (acquire) i zwracane (release). Nadmiarowe połączenia są zamykane.
+    """
+    def __init__(self, db_path: str, max_size: int = POOL_SIZE):
+        self.db_path = db_path
+        self.max_size = max_size
+        # LIFO - ostatnio użyte ("ciepłe") połączenie wraca jako pierwsze
+        self._idle = queue.LifoQueue(maxsize=max_size)
 
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=20, check_same_thread=False)
+        return _configure_connection(conn)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback() # Niezakończona transakcja nie może wyciec do kolejnego wywołującego
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Zwraca pulę dla bieżącego DB_PATH (bot.py nadpisuje go po imporcie)."""
+    pool = _pools.get(DB_PATH)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(DB_PATH, ConnectionPool(DB_PATH))
+    return pool
+
+def pooled_connection():
+    """Context manager wypożyczający połączenie z puli."""
+    return get_pool().connection()
+
+def close_pools():
+    """Zamyka wszystkie bezczynne połączenia we wszystkich pulach."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+def _run_in_transaction(conn, job):
+    """
+    Wykonuje zadanie zapisu w osobnej transakcji.
+    job(conn) zwraca (wynik, po_commit); po_commit (np. powiadomienie słuchaczy) jest wołane po zatwierdzeniu.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result, after_commit = job(conn)
         conn.commit()
     except Exception as e:
         conn.rollback()
         raise e
+    if after_commit is not None:
+        after_commit()
+    return result
+
+class DatabaseWriter:
+    """
+    Jedyny wątek zapisujący do pliku bazy w tym procesie.
+    Zadania (funkcje przyjmujące połączenie) trafiają do kolejki i wykonują się
+    po kolei na jednym połączeniu, więc zapisy z wielu wątków nie walczą o blokadę
+    SQLite (i nie czekają do timeout=20 s). Odczyty idą dalej równolegle przez pulę (WAL).
+
+    Group commit: zadania czekające w kolejce są zatwierdzane razem, w jednej transakcji
+    (każde we własnym SAVEPOINT, więc błąd jednego nie cofa pozostałych), najwyżej max_ops naraz.
+    Jeśli w grupie są same zapisy odroczone (write-behind), wątek czeka na kolejne
+    do max_delay sekund - jeden fsync obsługuje wtedy całą serię zapisów.
+    """
+    def __init__(self, db_path: str, max_ops: int = WRITE_BEHIND_MAX_OPS, max_delay: float = WRITE_BEHIND_MAX_DELAY):
+        self.db_path = db_path
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self._jobs = queue.Queue()
+        self._errors = []  # błędy zapisów odroczonych, zgłaszane przez flush()
+        self._errors_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"db-writer:{os.path.basename(db_path)}", daemon=True)
+        self._thread.start()
+
+    def _collect(self, first):
+        """Zbiera grupę zadań zaczynającą się od first; zwraca (grupa, czy_zakończyć)."""
+        group = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.max_ops:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                # Czekamy tylko, gdy nikt nie blokuje się na wyniku (same zapisy odroczone)
+                if remaining <= 0 or not all(deferred for _, _, deferred in group):
+                    break
+                try:
+                    item = self._jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                return group, True
+            group.append(item)
+        return group, False
+
+    def _run(self):
+        conn = _configure_connection(sqlite3.connect(self.db_path, timeout=20))
+        try:
+            while True:
+                item = self._jobs.get()
+                if item is None:
+                    return
+                group, stop = self._collect(item)
+                self._commit_group(conn, group)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_group(self, conn, group):
+        group = [(job, future, deferred) for job, future, deferred in group if future.set_running_or_notify_cancel()]
+        if not group:
+            return
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future, deferred in group:
+                conn.execute("SAVEPOINT write_job")
+                try:
+                    outcomes.append((True, job(conn)))
+                    conn.execute("RELEASE write_job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_job")
+                    conn.execute("RELEASE write_job")
+                    outcomes.append((False, e))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(False, e)] * len(group)
+        for (job, future, deferred), (ok, outcome) in zip(group, outcomes):
+            if ok:
+                result, after_commit = outcome
+                if after_commit is not None:
+                    after_commit()
+                future.set_result(result)
+            else:
+                if deferred:
+                    logger.error("Odroczony zapis do %s nieudany: %s", self.db_path, outcome)
+                    with self._errors_lock:
+                        self._errors.append(outcome)
+                future.set_exception(outcome)
+
+    def submit(self, job, deferred: bool = False) -> Future:
+        """
+        Dodaje zadanie job(conn) -> (wynik, po_commit) do kolejki; wynik lub wyjątek trafia do Future.
+        deferred=True oznacza zapis write-behind: nikt nie czeka na wynik, a błąd zgłosi flush().
+        """
+        future = Future()
+        self._jobs.put((job, future, deferred))
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Czeka, aż wszystkie wcześniej zlecone zapisy zostaną zatwierdzone.
+        Rzuca pierwszy błąd odroczonego zapisu od poprzedniego flush().
+        """
+        self.submit(lambda conn: (None, None)).result(timeout)
+        with self._errors_lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self, timeout: Optional[float] = None, discard_pending: bool = False):
+        """Kończy wątek po wykonaniu zadań z kolejki (albo po ich anulowaniu, discard_pending=True)."""
+        if discard_pending:
+            while True:
+                try:
+                    item = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].cancel()
+        self._jobs.put(None)
+        self._thread.join(timeout)
+
+_writers: Dict[str, DatabaseWriter] = {}
+
+def get_writer() -> DatabaseWriter:
+    """Zwraca (uruchamiając przy pierwszym użyciu) wątek zapisujący dla bieżącego DB_PATH."""
+    writer = _writers.get(DB_PATH)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(DB_PATH)
+            if writer is None:
+                writer = _writers[DB_PATH] = DatabaseWriter(DB_PATH)
+    return writer
+
+def flush_writes(timeout: Optional[float] = None) -> None:
+    """Czeka na zatwierdzenie wszystkich zleconych zapisów (także odroczonych) dla bieżącego DB_PATH."""
+    writer = _writers.get(DB_PATH)
+    if writer is not None:
+        writer.flush(timeout)
+
+def close_writers(discard_pending: bool = False):
+    """Zatrzymuje wątki zapisujące po opróżnieniu ich kolejek."""
+    with _pools_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close(discard_pending=discard_pending)
+
+def _close_writers_at_exit():
+    # Bez WRITE_BEHIND_FLUSH_ON_EXIT odroczone zapisy z kolejki przepadają przy wyjściu
+    close_writers(discard_pending=not WRITE_BEHIND_FLUSH_ON_EXIT)
+
+atexit.register(_close_writers_at_exit)
+
+def init_database():
+    """Inicjalizuje bazę danych: tworzy tabele i wykonuje zaległe migracje (PRAGMA user_version)."""
+    conn = get_connection()
+    try:
+        apply_migrations(conn, SCHEMA_MIGRATIONS)
     finally:
         conn.close()
+    # Migracje mogły dodać lub usunąć indeksy - get_by odczyta je ponownie
+    for key in [key for key in _table_indexes if key[0] == DB_PATH]:
+        del _table_indexes[key]
+
+def _log_query_plan(conn, query, params):
+    """Loguje EXPLAIN QUERY PLAN; pełne skany tabel jako ostrzeżenie."""
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    except sqlite3.Error as e:
+        logger.debug("EXPLAIN QUERY PLAN nieudany dla %s: %s", query, e)
+        return
+    details = [row[3] for row in plan]
+    if not details:
+        return
+    level = logging.WARNING if any(d.startswith('SCAN') for d in details) else logging.INFO
+    logger.log(level, "QUERY PLAN %s | %s", query, ' | '.join(details))
 
 def _safe_bool_convert(value):
     """Bezpieczna konwersja do bool przy odczycie."""
@@ -141,249 +626,1167 @@ def _safe_int_convert(value, default=0):
     except (ValueError, TypeError):
         return default
 
+@lru_cache(maxsize=4096)
+def _parse_json_list(value: str):
+    """json.loads z pamięcią - kolumny dni i przedmiotów mają niewiele różnych wartości."""
+    parsed = json.loads(value)
+    # Krotka w cache, żeby żaden rekord nie współdzielił modyfikowalnej listy
+    return tuple(parsed) if isinstance(parsed, list) else parsed
+
+def _decode_json_list(value):
+    if isinstance(value, str):
+        try:
+            parsed = _parse_json_list(value)
+        except json.JSONDecodeError:
+            # Fallback: jeśli to zwykły string, zrób z niego listę jednoelementową
+            return [value] if value else []
+        return list(parsed) if isinstance(parsed, tuple) else parsed
+    if value is None:
+        return []
+    return value
+
+def _encode_json_list(value):
+    if isinstance(value, list):
+        # To jest kluczowe: zamiana listy ['8:00'] na tekst '["8:00"]'
+        return json.dumps(value)
+    if isinstance(value, str) and not value.startswith('['):
+        # Jeśli ktoś podał string zamiast listy, napraw to
+        return json.dumps([value])
+    return value
+
+def _decode_bool(value):
+    return _safe_bool_convert(value if value is not None else 0)
+
+def _encode_bool(value):
+    if isinstance(value, str):
+        return 1 if value.lower() == 'true' else 0
+    return 1 if value else 0
+
+def _decode_int(value):
+    return _safe_int_convert(value, 0)
+
+def _decode_optional_int(value):
+    return None if value is None else _safe_int_convert(value, None)
+
+def _encode_optional_int(value):
+    if value == '' or value is None:
+        return None
+    return _safe_int_convert(value, None)
+
+# Typy kolumn wymagających konwersji; pozostałe kolumny przechodzą bez zmian
+COLUMN_TYPES = {
+    'json_list': (_decode_json_list, _encode_json_list),
+    'bool': (_decode_bool, _encode_bool),
+    'int': (_decode_int, _safe_int_convert),
+    'optional_int': (_decode_optional_int, _encode_optional_int),
+}
+
+TABLE_SCHEMAS = {
+    'Klienci': {
+        'wolna_kwota': 'int',
+    },
+    'Korepetytorzy': {
+        'Przedmioty': 'json_list', 'PoziomNauczania': 'json_list',
+        'Poniedziałek': 'json_list', 'Wtorek': 'json_list', 'Środa': 'json_list', 'Czwartek': 'json_list',
+        'Piątek': 'json_list', 'Sobota': 'json_list', 'Niedziela': 'json_list',
+        'LimitGodzinTygodniowo': 'optional_int',
+    },
+    'Rezerwacje': {
+        'JestTestowa': 'bool', 'Oplacona': 'bool', 'confirmed': 'bool',
+    },
+    RESERVATION_ARCHIVE_TABLE: {
+        'JestTestowa': 'bool', 'Oplacona': 'bool', 'confirmed': 'bool',
+    },
+    RESERVATION_HISTORY_VIEW: {
+        'JestTestowa': 'bool', 'Oplacona': 'bool', 'confirmed': 'bool',
+    },
+    'StaleRezerwacje': {
+        'Aktywna': 'bool',
+    },
+}
+
+# Kolumny techniczne, które nie trafiają do 'fields'
+HIDDEN_COLUMNS = frozenset(['created_at', 'confirmation_deadline', 'archived_at', START_TS_COLUMN])
+
+class LazyFields(dict):
+    """
+    Słownik pól, w którym wskazane kolumny są dekodowane dopiero przy pierwszym odczycie.
+    Każda operacja na całym słowniku (items, values, kopiowanie, porównanie) dekoduje resztę.
+    """
+    __slots__ = ('_pending', '_decoders')
+
+    def __init__(self, data, decoders):
+        super().__init__(data)
+        self._decoders = decoders
+        self._pending = set(decoders)
+
+    def _resolve(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            dict.__setitem__(self, key, self._decoders[key](dict.__getitem__(self, key)))
+
+    def _resolve_all(self):
+        for key in list(self._pending):
+            self._resolve(key)
+
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __iter__(self):
+        # Nadpisanie wymusza na dict()/{**x} ścieżkę przez keys() + __getitem__
+        return dict.__iter__(self)
+
+    def __eq__(self, other):
+        self._resolve_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        self._resolve_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._resolve_all()
+        return dict(dict.items(self))
+
+    def pop(self, key, *default):
+        self._resolve(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._resolve_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._resolve(key)
+        return dict.setdefault(self, key, default)
+
+class CompactRecord(tuple):
+    """
+    Baza zwartych rekordów (DatabaseTable(..., compact=True)): namedtuple z kolumnami jako atrybutami,
+    np. record.id, record.Data. Zamiast dwóch słowników i id jako tekstu na wiersz - jedna krotka.
+    Zgodność z formatem Airtable: record['id'] i record['fields'] (słownik budowany przy dostępie)
+    oraz as_airtable().
+    """
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __getitem__(self, key):
+        if key == 'id':
+            return str(tuple.__getitem__(self, 0))
+        if key == 'fields':
+            return dict(zip(self._fields[1:], tuple.__getitem__(self, slice(1, None))))
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in ('id', 'fields') else default
+
+    def as_airtable(self) -> Dict[str, Any]:
+        """Rekord w formacie Airtable: {'id': str, 'fields': dict}."""
+        return {'id': self['id'], 'fields': self['fields']}
+
+def _compact_record_class(table_name: str, columns: Tuple[str, ...]):
+    base = namedtuple(f"{table_name}Record", columns, rename=True)
+    return type(base.__name__, (CompactRecord, base), {'__slots__': (), '_fields': base._fields})
+
+class RowCodec:
+    """
+    Konwersja wierszy jednej tabeli, zbudowana raz z TABLE_SCHEMAS.
+    Dla każdego zestawu kolumn (cursor.description) powstaje plan: które indeksy
+    kopiować wprost, a które przepuścić przez dekoder.
+    """
+    def __init__(self, table_name: str, lazy_lists: bool = False, compact: bool = False):
+        self.table_name = table_name
+        # compact=True: wiersze jako CompactRecord zamiast {'id', 'fields'}
+        self.compact = compact
+        schema = TABLE_SCHEMAS.get(table_name, {})
+        self.decoders = {col: COLUMN_TYPES[kind][0] for col, kind in schema.items()}
+        self.encoders = {col: COLUMN_TYPES[kind][1] for col, kind in schema.items()}
+        # Kolumny list JSON dekodowane leniwie (opcjonalnie, dla Korepetytorzy)
+        self.lazy_columns = frozenset(col for col, kind in schema.items() if kind == 'json_list') if lazy_lists else frozenset()
+        self.derived = DERIVED_COLUMNS.get(table_name, {})
+        self._plans = {}
+
+    def _plan(self, columns: Tuple[str, ...]):
+        plan = self._plans.get(columns)
+        if plan is None and self.compact:
+            plan = self._plans[columns] = self._compact_plan(columns)
+        if plan is None:
+            id_index = columns.index('id')
+            names, indices, eager, lazy = [], [], [], {}
+            for index, name in enumerate(columns):
+                if name == 'id' or name in HIDDEN_COLUMNS:
+                    continue
+                names.append(name)
+                indices.append(index)
+                decoder = self.decoders.get(name)
+                if decoder is None:
+                    continue
+                if name in self.lazy_columns:
+                    lazy[name] = decoder
+                else:
+                    eager.append((name, decoder))
+            if len(indices) == 1:
+                only = indices[0]
+                getter = lambda row: (row[only],)
+            elif indices:
+                getter = itemgetter(*indices)
+            else:
+                getter = lambda row: ()
+            plan = (id_index, tuple(names), getter, tuple(eager), lazy)
+            self._plans[columns] = plan
+        return plan
+
+    def _compact_plan(self, columns: Tuple[str, ...]):
+        # id na pozycji 0, dalej kolumny widoczne; dekodery stosowane od razu (krotka jest niezmienna)
+        indices = [columns.index('id')] + [i for i, name in enumerate(columns) if name != 'id' and name not in HIDDEN_COLUMNS]
+        names = tuple(columns[i] for i in indices)
+        eager = tuple((position, self.decoders[name]) for position, name in enumerate(names) if name in self.decoders)
+        return (_compact_record_class(self.table_name, names), itemgetter(*indices) if len(indices) > 1 else (lambda row: (row[indices[0]],)), eager)
+
+    def _decode_compact(self, plan, row) -> CompactRecord:
+        record_class, getter, eager = plan
+        values = getter(row)
+        if eager:
+            values = list(values)
+            for position, decoder in eager:
+                values[position] = decoder(values[position])
+        return tuple.__new__(record_class, values)
+
+    def _decode(self, plan, row) -> Dict[str, Any]:
+        if self.compact:
+            return self._decode_compact(plan, row)
+        id_index, names, getter, eager, lazy = plan
+        fields = dict(zip(names, getter(row)))
+        for name, decoder in eager:
+            fields[name] = decoder(fields[name])
+        if lazy:
+            fields = LazyFields(fields, {name: d for name, d in lazy.items() if name in fields})
+        return {'id': str(row[id_index]), 'fields': fields}
+
+    def decode_row(self, row: sqlite3.Row) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        return self._decode(self._plan(tuple(row.keys())), row)
+
+    def decode_rows(self, description, rows) -> List[Dict[str, Any]]:
+        """Dekoduje wiele wierszy z jednego zapytania - plan jest wyznaczany raz."""
+        if not rows:
+            return []
+        plan = self._plan(tuple(col[0] for col in description))
+        decode = self._decode_compact if self.compact else self._decode
+        return [decode(plan, row) for row in rows]
+
+    def encode(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        encoders = self.encoders
+        encoded = {name: (encoders[name](value) if name in encoders else value) for name, value in fields.items()}
+        for column, (sources, function_name) in self.derived.items():
+            # Kolumna wyliczana nie jest zapisywana wprost; liczymy ją, gdy zapis ma wszystkie źródła
+            encoded.pop(column, None)
+            if all(source in encoded for source in sources):
+                encoded[column] = SQL_FUNCTIONS[function_name][1](*(encoded[source] for source in sources))
+        return encoded
+
+    def partially_derived(self, columns) -> Dict[str, Tuple[Tuple[str, ...], str]]:
+        """Kolumny wyliczane, z których źródeł zapis zmienia tylko część (np. samą Godzinę)."""
+        return {column: rule for column, rule in self.derived.items()
+                if column not in columns and any(source in columns for source in rule[0])}
+
+_codecs: Dict[Tuple[str, bool, bool], RowCodec] = {}
+
+def get_row_codec(table_name: str, lazy_lists: bool = False, compact: bool = False) -> RowCodec:
+    """Zwraca (współdzielony) codec dla tabeli."""
+    key = (table_name, lazy_lists, compact)
+    codec = _codecs.get(key)
+    if codec is None:
+        codec = _codecs.setdefault(key, RowCodec(table_name, lazy_lists, compact))
+    return codec
+
+# Słuchacze zapisów: table_name -> [callback(action, record_ids, field_names)].
+# Wołani po commit w tym samym procesie; action to 'create', 'update' albo 'delete'.
+_write_listeners: Dict[str, List] = {}
+
+def add_write_listener(table_name: str, callback) -> None:
+    _write_listeners.setdefault(table_name, []).append(callback)
+
+def remove_write_listener(table_name: str, callback) -> None:
+    listeners = _write_listeners.get(table_name, [])
+    if callback in listeners:
+        listeners.remove(callback)
+
+def _notify_write(table_name: str, action: str, record_ids: List[str], field_names=()) -> None:
+    for callback in list(_write_listeners.get(table_name, ())):
+        try:
+            callback(action, record_ids, tuple(field_names))
+        except Exception as e:
+            # Błąd słuchacza (np. cache) nie może cofnąć zapisu, który już jest w bazie
+            logger.error("Błąd słuchacza zapisów tabeli %s: %s", table_name, e)
+
+# Tabele z licznikiem TableVersions (triggery z migracji 7, 9 i 10)
+VERSIONED_TABLES = frozenset(['Korepetytorzy', 'Rezerwacje', 'StaleRezerwacje', 'Klienci'])
+
+# Słuchacze wersji: table_name -> [callback(db_path, przed, po)]. Wołani po commit zapisu DatabaseTable
+# (już po słuchaczach zapisów) z wartościami licznika tabeli przed i po tym zapisie.
+_version_listeners: Dict[str, List] = {}
+
+def add_version_listener(table_name: str, callback) -> None:
+    _version_listeners.setdefault(table_name, []).append(callback)
+
+def remove_version_listener(table_name: str, callback) -> None:
+    listeners = _version_listeners.get(table_name, [])
+    if callback in listeners:
+        listeners.remove(callback)
+
+def _notify_version(table_name: str, db_path: str, before: int, after: int) -> None:
+    for callback in list(_version_listeners.get(table_name, ())):
+        try:
+            callback(db_path, before, after)
+        except Exception as e:
+            logger.error("Błąd słuchacza wersji tabeli %s: %s", table_name, e)
+
+def _table_version(conn, table_name: str) -> Optional[int]:
+    try:
+        row = conn.execute("SELECT version FROM TableVersions WHERE name = ?", [table_name]).fetchone()
+    except sqlite3.OperationalError:
+        return None # Baza przed migracją 7
+    return row[0] if row is not None else None
+
+class TableVersionWatch:
+    """
+    Wykrywa zapisy tabel, których nie obsłużyli słuchacze zapisów tego procesu - z innych
+    procesów (np. backendu) albo surowym SQL. Najpierw tani test PRAGMA data_version na własnym
+    połączeniu (zmienia się po commicie każdego innego połączenia), dopiero wtedy liczniki TableVersions.
+
+    Po attach() zapisy DatabaseTable w tym procesie zgłaszają, o ile podbiły licznik (przed -> po);
+    takie podbicia są "wyjaśnione" i changed() ich nie zgłasza. Zgłaszane są tylko tabele,
+    których licznika nie da się wyjaśnić albo które licznika nie mają.
+    Bez db_path podąża za DB_PATH - po zmianie ścieżki wszystkie tabele są traktowane jako zmienione.
+    """
+
+    def __init__(self, tables, db_path: Optional[str] = None):
+        self.tables = tuple(tables)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._path = None
+        self._data_version = None
+        self._versions = {}
+        self._explained = {table: {} for table in self.tables}   # tabela -> {przed: po}
+        self._callbacks = {table: (lambda path, before, after, table=table: self._explain(table, path, before, after))
+                           for table in self.tables}
+
+    def attach(self) -> 'TableVersionWatch':
+        """Przyjmuje wyjaśnienia od zapisów DatabaseTable - tylko gdy właściciel obsługuje je słuchaczem zapisów."""
+        for table, callback in self._callbacks.items():
+            add_version_listener(table, callback)
+        return self
+
+    def detach(self) -> None:
+        for table, callback in self._callbacks.items():
+            remove_version_listener(table, callback)
+
+    def _explain(self, table: str, db_path: str, before: int, after: int) -> None:
+        with self._lock:
+            if db_path == (self.db_path or DB_PATH):
+                self._explained[table][before] = after
+
+    def changed(self) -> Set[str]:
+        """Tabele zmienione od poprzedniego wywołania w sposób niewyjaśniony (za pierwszym razem - wszystkie)."""
+        with self._lock:
+            path = self.db_path or DB_PATH
+            if self._conn is None or self._path != path:
+                self._disconnect()
+                self._path = path
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return set()
+            placeholders = ', '.join(['?' for _ in self.tables])
+            try:
+                versions = dict(self._conn.execute(
+                    f"SELECT name, version FROM TableVersions WHERE name IN ({placeholders})", self.tables).fetchall())
+            except sqlite3.OperationalError:
+                versions = {} # Baza przed migracją - bez liczników wszystko jest podejrzane
+            self._data_version = data_version
+            changed = set()
+            for table in self.tables:
+                current, seen = versions.get(table), self._versions.get(table)
+                steps = self._explained[table]
+                while seen is not None and seen != current and seen in steps:
+                    seen = steps.pop(seen)
+                if current is None or seen != current:
+                    changed.add(table)
+                # Wyjaśnienia starszych wersji już się nie przydadzą (np. spóźnione po pełnym unieważnieniu)
+                for before in [b for b in steps if current is None or b < current]:
+                    del steps[before]
+            self._versions = versions
+            return changed
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._data_version = None
+        self._versions = {}
+
+def _copy_record(record: Optional[Dict]) -> Optional[Dict]:
+    """Kopia rekordu (z listami), żeby wywołujący nie zmieniał wpisu w cache."""
+    if record is None:
+        return None
+    if isinstance(record, CompactRecord):
+        return tuple.__new__(type(record), [list(value) if isinstance(value, list) else value for value in record])
+    fields = {name: (list(value) if isinstance(value, list) else value) for name, value in record['fields'].items()}
+    return {'id': record['id'], 'fields': fields}
+
+class RecordCache:
+    """
+    Cache LRU z TTL przed DatabaseTable.get/first dla jednej tabeli.
+    Klucze: ('id', id, pola) oraz ('formula', skompilowany WHERE, parametry, pola).
+
+    Unieważnianie:
+    - zapisy przez DatabaseTable w tym procesie (słuchacz zapisów) usuwają wpisy
+      zapisanych id i wszystkie wyniki formuł - od razu, przed powrotem z create/update/delete;
+    - zapis tabeli spoza słuchaczy tego procesu (inny proces, surowy SQL) czyści cały cache.
+      Wykrywa go TableVersionWatch: PRAGMA data_version jako tani pierwszy test, potem licznik
+      TableVersions tej tabeli - zapisy innych tabel cache nie czyszczą. Tabela bez licznika
+      jest czyszczona po każdym commicie innego połączenia. Sprawdzane najwyżej co
+      version_check_interval sekund.
+    """
+    def __init__(self, db_path: str, table_name: str, maxsize: int = RECORD_CACHE_SIZE,
+                 ttl: float = RECORD_CACHE_TTL, version_check_interval: float = 0.0):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()   # klucz -> (wygasa_o, rekord)
+        self._keys_by_id = {}           # id -> klucze wpisów tego rekordu
+        self._lock = threading.Lock()
+        self._generation = 0            # zwiększana przy każdym unieważnieniu
+        self._watch = TableVersionWatch([table_name], db_path)
+        self._version_checked_at = 0.0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _check_versions(self, now: float):
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        if self._watch.changed():
+            self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._keys_by_id.clear()
+        self._generation += 1
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        if key[0] == 'id':
+            keys = self._keys_by_id.get(key[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_id[key[1]]
+
+    def lookup(self, key) -> Tuple[bool, Optional[Dict], int]:
+        """Zwraca (trafienie, kopia rekordu, generacja); generację przekazuje się do store()."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_versions(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, record = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, _copy_record(record), self._generation
+                self._remove(key)
+            self.misses += 1
+            return False, None, self._generation
+
+    def store(self, key, record: Optional[Dict], generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return # W międzyczasie był zapis - odczytany rekord może być nieaktualny
+            self._entries[key] = (time.monotonic() + self.ttl, _copy_record(record))
+            self._entries.move_to_end(key)
+            if key[0] == 'id':
+                self._keys_by_id.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, record_ids: List[str]) -> None:
+        """Usuwa wpisy podanych id i wszystkie wyniki formuł (zapis może zmienić każdy z nich)."""
+        with self._lock:
+            for record_id in record_ids:
+                for key in list(self._keys_by_id.get(record_id, ())):
+                    self._remove(key)
+            for key in [k for k in self._entries if k[0] == 'formula']:
+                self._remove(key)
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _on_write(self, action, record_ids, field_names):
+        self.invalidate(record_ids)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'size': len(self._entries)}
+
+_record_caches: Dict[Tuple[str, str, bool], RecordCache] = {}
+_record_caches_lock = threading.Lock()
+
+def get_record_cache(table_name: str, compact: bool = False) -> RecordCache:
+    """
+    Współdzielony cache rekordów tabeli dla bieżącego DB_PATH.
+    Osobny dla compact=True, bo trzyma rekordy w innym formacie (CompactRecord zamiast słowników).
+    """
+    key = (DB_PATH, table_name, compact)
+    with _record_caches_lock:
+        cache = _record_caches.get(key)
+        if cache is None:
+            cache = RecordCache(DB_PATH, table_name)
+            add_write_listener(table_name, cache._on_write)
+            cache._watch.attach()
+            _record_caches[key] = cache
+        return cache
+
+AGGREGATE_FUNCTIONS = ('count', 'sum', 'min', 'max', 'avg')
+
+def _as_timestamp(value) -> int:
+    """Czas uniksowy z datetime (bez strefy = Europe/Warsaw), liczby albo tekstu 'YYYY-MM-DD[ HH:MM]'."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = LOCAL_TIMEZONE.localize(value, is_dst=False)
+        return int(value.timestamp())
+    if isinstance(value, (int, float)):
+        return int(value)
+    timestamp = local_timestamp(value)
+    if timestamp is None:
+        raise ValueError(f"Nieprawidłowy czas {value!r} (oczekiwano 'YYYY-MM-DD[ HH:MM]')")
+    return timestamp
+
+def _quote_column(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+# Opis indeksu z PRAGMA index_list / index_info
+IndexInfo = namedtuple('IndexInfo', ['columns', 'unique', 'partial'])
+
+# (DB_PATH, tabela) -> {indeks: IndexInfo}, dla DatabaseTable.get_by
+_table_indexes: Dict[Tuple[str, str], Dict[str, IndexInfo]] = {}
+
 class DatabaseTable:
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, lazy_lists: bool = False, cache: bool = False,
+                 serialized_writes: Optional[bool] = None, write_behind: bool = False, compact: bool = False):
         self.table_name = table_name
+        # serialized_writes=True: create/update/delete/batch_* idą przez DatabaseWriter (domyślnie SERIALIZED_WRITES)
+        self._serialized_writes = SERIALIZED_WRITES if serialized_writes is None else serialized_writes
+        # write_behind=True: zapisy wracają od razu (None), a wątek zapisujący zatwierdza je grupami;
+        # flush() czeka na zapis i zgłasza błędy
+        self._write_behind = write_behind
+        # lazy_lists=True: kolumny list JSON (np. dni tygodnia korepetytora) dekodowane przy pierwszym dostępie
+        # compact=True: wyniki jako CompactRecord (atrybuty, np. r.Data) - mniej pamięci przy dużych raportach
+        self._codec = get_row_codec(table_name, lazy_lists, compact)
+        # cache=True: get()/first() czytają przez współdzielony RecordCache tabeli
+        self._cache = get_record_cache(table_name, compact) if cache else None
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """Liczniki cache (hits, misses, evictions, invalidations, size) albo None bez cache."""
+        return self._cache.stats() if self._cache else None
     
+    def _execute(self, cursor, query: str, params=()):
+        """Wykonuje zapytanie; w trybie EXPLAIN_QUERY_PLAN najpierw loguje jego plan."""
+        if EXPLAIN_QUERY_PLAN:
+            _log_query_plan(cursor.connection, query, params)
+        return cursor.execute(query, params)
+
     def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
         """Konwertuje wiersz SQLite do formatu Airtable z bezpiecznym typowaniem."""
-        if row is None:
-            return None
-        
-        fields = dict(row)
-        record_id = fields.pop('id')
-        fields.pop('created_at', None)
-        fields.pop('confirmation_deadline', None)
-        
-        # 1. Obsługa list (JSON)
-        if self.table_name == 'Korepetytorzy':
-            # DODAJEMY DNI TYGODNIA DO TEJ LISTY
-            days_and_lists = ['Przedmioty', 'PoziomNauczania', 'Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela']
-            
-            for list_col in days_and_lists:
-                val = fields.get(list_col)
-                if isinstance(val, str):
-                    try:
-                        fields[list_col] = json.loads(val)
-                    except json.JSONDecodeError:
-                        # Fallback: jeśli to zwykły string, zrób z niego listę jednoelementową
-                        fields[list_col] = [val] if val else []
-                elif val is None:
-                    fields[list_col] = []
-        
-        # 2. Obsługa Boolean (bezpieczny odczyt)
-        bool_fields = []
-        if self.table_name == 'Rezerwacje':
-            bool_fields = ['JestTestowa', 'Oplacona', 'confirmed']
-        elif self.table_name == 'StaleRezerwacje':
-            bool_fields = ['Aktywna']
-            
-        for bf in bool_fields:
-            fields[bf] = _safe_bool_convert(fields.get(bf, 0))
-
-        # 3. Obsługa Integer (bezpieczny odczyt)
-        if self.table_name == 'Klienci':
-            fields['wolna_kwota'] = _safe_int_convert(fields.get('wolna_kwota'), 0)
-        elif self.table_name == 'Korepetytorzy':
-            if fields.get('LimitGodzinTygodniowo') is not None:
-                fields['LimitGodzinTygodniowo'] = _safe_int_convert(fields.get('LimitGodzinTygodniowo'), None)
-        
-        return {'id': str(record_id), 'fields': fields}
+        return self._codec.decode_row(row)
+    
+    def _rows_to_dicts(self, cursor, rows) -> List[Dict[str, Any]]:
+        """Jak _row_to_dict, ale dla wyniku całego zapytania (plan kolumn liczony raz)."""
+        return self._codec.decode_rows(cursor.description, rows)
     
     def _prepare_fields_for_write(self, fields: Dict[str, Any]) -> Dict[str, Any]:
         """Przygotowuje i czyści dane przed zapisem do bazy."""
-        clean_fields = fields.copy()
-        
-        # 1. Konwersja List -> JSON String
-        if self.table_name == 'Korepetytorzy':
-            # Lista wszystkich kolumn, które mogą być listami
-            columns_to_json = [
-                'Przedmioty', 'PoziomNauczania', 
-                'Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela'
-            ]
-            
-            for list_col in columns_to_json:
-                if list_col in clean_fields:
-                    val = clean_fields[list_col]
-                    if isinstance(val, list):
-                        # To jest kluczowe: zamiana listy ['8:00'] na tekst '["8:00"]'
-                        clean_fields[list_col] = json.dumps(val)
-                    elif isinstance(val, str) and not val.startswith('['):
-                        # Jeśli ktoś podał string zamiast listy, napraw to
-                        clean_fields[list_col] = json.dumps([val])
-        # 2. Konwersja Boolean -> 0/1
-        bool_fields = []
-        if self.table_name == 'Rezerwacje':
-            bool_fields = ['JestTestowa', 'Oplacona', 'confirmed']
-        elif self.table_name == 'StaleRezerwacje':
-            bool_fields = ['Aktywna']
-            
-        for bf in bool_fields:
-            if bf in clean_fields:
-                val = clean_fields[bf]
-                if isinstance(val, str):
-                    clean_fields[bf] = 1 if val.lower() == 'true' else 0
-                else:
-                    clean_fields[bf] = 1 if val else 0
+        return self._codec.encode(fields)
 
-        # 3. Konwersja Integer
-        if self.table_name == 'Klienci' and 'wolna_kwota' in clean_fields:
-            clean_fields['wolna_kwota'] = _safe_int_convert(clean_fields['wolna_kwota'])
-            
-        if self.table_name == 'Korepetytorzy' and 'LimitGodzinTygodniowo' in clean_fields:
-             if clean_fields['LimitGodzinTygodniowo'] == '' or clean_fields['LimitGodzinTygodniowo'] is None:
-                 clean_fields['LimitGodzinTygodniowo'] = None
-             else:
-                 clean_fields['LimitGodzinTygodniowo'] = _safe_int_convert(clean_fields['LimitGodzinTygodniowo'], None)
+    def _track_version(self, job):
+        """
+        Dla tabel z licznikiem TableVersions: odczyt licznika przed i po zadaniu, w tej samej
+        transakcji (pod blokadą zapisu nikt inny go nie zmieni). Po commit i po słuchaczach
+        zapisów TableVersionWatch dostaje przedział podbić, który wyjaśnia ten zapis.
+        """
+        if self.table_name not in VERSIONED_TABLES:
+            return job
+        table_name, db_path = self.table_name, DB_PATH
 
-        return clean_fields
+        def tracked(conn):
+            before = _table_version(conn, table_name)
+            result, after_commit = job(conn)
+            after = _table_version(conn, table_name)
 
-    def create(self, fields: Dict[str, Any]) -> Dict:
-        conn = get_connection()
-        try:
+            def notify():
+                if after_commit is not None:
+                    after_commit()
+                if before is not None and after is not None and after != before:
+                    _notify_version(table_name, db_path, before, after)
+            return result, notify
+        return tracked
+
+    def _submit(self, job) -> Future:
+        """Zadanie zapisu przez wątek zapisujący (warianty *_async)."""
+        return get_writer().submit(self._track_version(job))
+
+    def _run_write(self, job):
+        """
+        Wykonuje zadanie zapisu: odroczone przez wątek zapisujący (write-behind, zwraca None),
+        przez wątek zapisujący z czekaniem na wynik, albo w transakcji na połączeniu z puli.
+        """
+        job = self._track_version(job)
+        if self._write_behind:
+            get_writer().submit(job, deferred=True)
+            return None
+        if self._serialized_writes:
+            return get_writer().submit(job).result()
+        with pooled_connection() as conn:
+            return _run_in_transaction(conn, job)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Czeka na zatwierdzenie odroczonych zapisów; rzuca pierwszy błąd, jeśli któryś się nie udał."""
+        flush_writes(timeout)
+
+    def _after_write(self, action: str, record_ids: List[str], field_names=()):
+        return lambda: _notify_write(self.table_name, action, record_ids, field_names)
+
+    def _sync_derived(self, cursor, columns, record_ids: List[str]):
+        """Przelicza w SQL kolumny wyliczane, gdy zapis zmienił tylko część ich źródeł."""
+        stale = self._codec.partially_derived(columns)
+        if not stale or not record_ids:
+            return
+        set_clause = ', '.join(f"{column} = {function_name}({', '.join(sources)})"
+                               for column, (sources, function_name) in stale.items())
+        for i in range(0, len(record_ids), BATCH_CHUNK_SIZE):
+            chunk = record_ids[i:i + BATCH_CHUNK_SIZE]
+            self._execute(cursor, f"UPDATE {self.table_name} SET {set_clause} WHERE id IN ({', '.join(['?' for _ in chunk])})", chunk)
+
+    def _create_job(self, fields: Dict[str, Any], return_record: bool):
+        # Pola kodowane od razu: zadanie trzyma własną kopię, nawet gdy wątek zapisujący wykona je później
+        prepared_fields = self._prepare_fields_for_write(fields)
+
+        def job(conn):
             cursor = conn.cursor()
             
-            prepared_fields = self._prepare_fields_for_write(fields)
-            
             columns = ', '.join(prepared_fields.keys())
             placeholders = ', '.join(['?' for _ in prepared_fields])
             query = f"INSERT INTO {self.table_name} ({columns}) VALUES ({placeholders})"
+            if return_record:
+                # Zapis i odczyt w jednym poleceniu zamiast osobnego SELECT po commit
+                query += " RETURNING *"
             
-            cursor.execute(query, list(prepared_fields.values()))
-            record_id = cursor.lastrowid
-            conn.commit()
-            return self.get(str(record_id))
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def update(self, record_id: str, fields: Dict[str, Any]) -> Dict:
-        conn = get_connection()
-        try:
+            self._execute(cursor, query, list(prepared_fields.values()))
+            row = cursor.fetchone() if return_record else None
+            record_id = row['id'] if row is not None else cursor.lastrowid
+            return self._row_to_dict(row), self._after_write('create', [str(record_id)], prepared_fields.keys())
+        return job
+
+    def create(self, fields: Dict[str, Any], return_record: bool = True) -> Optional[Dict]:
+        """Wstawia rekord; z return_record=False (albo w trybie write-behind) zwraca None."""
+        return self._run_write(self._create_job(fields, return_record))
+
+    def create_async(self, fields: Dict[str, Any], return_record: bool = True) -> Future:
+        """Jak create, ale przez wątek zapisujący; zwraca Future z rekordem."""
+        return self._submit(self._create_job(fields, return_record))
+
+    def _update_job(self, record_id: str, fields: Dict[str, Any], return_record: bool):
+        prepared_fields = self._prepare_fields_for_write(fields)
+
+        def job(conn):
             cursor = conn.cursor()
             
-            prepared_fields = self._prepare_fields_for_write(fields)
-            
             set_clause = ', '.join([f"{k} = ?" for k in prepared_fields.keys()])
             query = f"UPDATE {self.table_name} SET {set_clause} WHERE id = ?"
+            if return_record:
+                query += " RETURNING *"
             
-            cursor.execute(query, list(prepared_fields.values()) + [record_id])
-            conn.commit()
-            return self.get(record_id)
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+            self._execute(cursor, query, list(prepared_fields.values()) + [record_id])
+            row = cursor.fetchone() if return_record else None
+            self._sync_derived(cursor, prepared_fields.keys(), [str(record_id)])
+            return self._row_to_dict(row), self._after_write('update', [str(record_id)], prepared_fields.keys())
+        return job
+
+    def update(self, record_id: str, fields: Dict[str, Any], return_record: bool = True) -> Optional[Dict]:
+        """Aktualizuje rekord; z return_record=False (albo w trybie write-behind) zwraca None."""
+        return self._run_write(self._update_job(record_id, fields, return_record))
+
+    def update_async(self, record_id: str, fields: Dict[str, Any], return_record: bool = True) -> Future:
+        """Jak update, ale przez wątek zapisujący; zwraca Future z rekordem."""
+        return self._submit(self._update_job(record_id, fields, return_record))
+
+    def _upsert_job(self, key_field: str, records: List[Dict[str, Any]], on_conflict: str):
+        if on_conflict not in ('ignore', 'update'):
+            raise ValueError(f"on_conflict musi być 'ignore' albo 'update', podano: {on_conflict!r}")
+        if any(key_field not in fields for fields in records):
+            raise ValueError(f"Każdy rekord upsert musi zawierać pole klucza {key_field}")
+        groups = self._group_by_columns(enumerate(records))
+        prepared_keys = [self._prepare_fields_for_write({key_field: fields[key_field]})[key_field] for fields in records]
+
+        def job(conn):
+            cursor = conn.cursor()
+            # Wiersze z id powyżej dotychczasowego maksimum zostały wstawione, pozostałe - zaktualizowane
+            max_id = cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table_name}").fetchone()[0]
+            by_key = {}
+            written_columns = set()
+            for columns, group in groups.items():
+                written_columns.update(columns)
+                key_position = columns.index(key_field)
+                updated_columns = [column for column in columns if column != key_field]
+                if on_conflict == 'update' and updated_columns:
+                    conflict_clause = f"DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updated_columns)}"
+                else:
+                    conflict_clause = "DO NOTHING"
+                row_placeholders = '(' + ', '.join(['?' for _ in columns]) + ')'
+                # Jedno polecenie na porcję wierszy (limit zmiennych SQLite: 32766)
+                chunk_size = max(1, min(BATCH_CHUNK_SIZE, 32766 // len(columns)))
+                for i in range(0, len(group), chunk_size):
+                    chunk = group[i:i + chunk_size]
+                    query = (f"INSERT INTO {self.table_name} ({', '.join(columns)}) "
+                             f"VALUES {', '.join([row_placeholders] * len(chunk))} "
+                             f"ON CONFLICT({key_field}) {conflict_clause} RETURNING *")
+                    params = [value for _, fields in chunk for value in fields.values()]
+                    self._execute(cursor, query, params)
+                    for record in self._rows_to_dicts(cursor, cursor.fetchall()):
+                        by_key[record['fields'].get(key_field)] = record
+                    # DO NOTHING nie zwraca wierszy, które już istniały - dobieramy je osobno
+                    missing = list(dict.fromkeys(fields[key_field] for _, fields in chunk
+                                                 if fields[key_field] not in by_key))
+                    if missing:
+                        self._execute(cursor, f"SELECT * FROM {self.table_name} WHERE {key_field} IN ({', '.join(['?' for _ in missing])})", missing)
+                        for record in self._rows_to_dicts(cursor, cursor.fetchall()):
+                            by_key[record['fields'].get(key_field)] = record
+            result = [by_key.get(key) for key in prepared_keys]
+            if on_conflict == 'update':
+                self._sync_derived(cursor, written_columns, [r['id'] for r in by_key.values()])
+            created = [r['id'] for r in by_key.values() if int(r['id']) > max_id]
+            updated = [r['id'] for r in by_key.values() if int(r['id']) <= max_id] if on_conflict == 'update' else []
+
+            def after_commit():
+                if created:
+                    _notify_write(self.table_name, 'create', created, written_columns)
+                if updated:
+                    _notify_write(self.table_name, 'update', updated, written_columns - {key_field})
+            return result, after_commit
+        return job
+
+    def upsert(self, key_field: str, fields: Dict[str, Any], on_conflict: str = 'update') -> Optional[Dict]:
+        """
+        Wstawia rekord albo - gdy istnieje już rekord o tej samej wartości key_field (kolumna UNIQUE) -
+        aktualizuje go (on_conflict='update') lub zostawia bez zmian ('ignore').
+        Jedno polecenie INSERT ... ON CONFLICT ... RETURNING, bez wyścigu między first() a create().
+        Zwraca rekord po zapisie (w trybie write-behind None).
+        """
+        result = self._run_write(self._upsert_job(key_field, [fields], on_conflict))
+        return result[0] if result else None
+
+    def batch_upsert(self, key_field: str, records: List[Dict[str, Any]], on_conflict: str = 'update') -> List[Dict]:
+        """Jak upsert dla listy słowników pól - jedno polecenie na porcję; zwraca rekordy w kolejności wejścia."""
+        if not records:
+            return []
+        return self._run_write(self._upsert_job(key_field, records, on_conflict))
 
     def _convert_formula_to_sql(self, formula: str) -> tuple:
-        if not formula: return ("1=1", [])
-        
-        simple_eq = re.search(r"\{([^}]+)\}\s*=\s*'([^']*)'", formula)
-        if simple_eq and 'AND' not in formula and 'OR' not in formula:
-            return (f'"{simple_eq.group(1)}"' + " = ?", [simple_eq.group(2)])
-        
-        and_pattern = re.findall(r"AND\((.+)\)", formula, re.DOTALL)
-        if and_pattern:
-            content = and_pattern[0]
-            parts = []
-            in_parens = False
-            last_split = 0
-            for i, char in enumerate(content):
-                if char == '(':
-                    in_parens = True
-                elif char == ')':
-                    in_parens = False
-                elif char == ',' and not in_parens:
-                    parts.append(content[last_split:i].strip())
-                    last_split = i + 1
-            parts.append(content[last_split:].strip())
-
-            conditions, params = [], []
-            for part in parts:
-                part = part.strip()
-                if not part: continue
-                
-                eq_match = re.search(r"\{([^}]+)\}\s*=\s*'([^']*)'", part)
-                dt_match = re.search(r"DATETIME_FORMAT\(\{([^}]+)\}.*?\)\s*=\s*'([^']*)'", part)
-
-                if dt_match:
-                    field_name, value = dt_match.groups()
-                    conditions.append(f'"{field_name}" = ?')
-                    params.append(value)
-                elif eq_match:
-                    field_name, value = eq_match.groups()
-                    conditions.append(f'"{field_name}" = ?')
-                    params.append(value)
-
-            if conditions:
-                return (" AND ".join(conditions), params)
-
-        return ("1=1", []) # Fallback
-
-    def first(self, formula: str = None) -> Optional[Dict]:
-        conn = get_connection()
-        try:
+        """Kompiluje formułę Airtable do (WHERE, parametry) - wynik jest cache'owany per formuła."""
+        where, params = compile_formula(formula)
+        return (where, list(params))
+
+    def _select_list(self, fields: Optional[List[str]], alias: Optional[str] = None) -> str:
+        """Lista kolumn dla SELECT; id jest pobierane zawsze, bo z niego powstaje rekord."""
+        prefix = f"{alias}." if alias else ''
+        if not fields:
+            return f"{prefix}*"
+        columns = ['id'] + [name for name in dict.fromkeys(fields) if name != 'id']
+        return ', '.join(prefix + _quote_column(name) for name in columns)
+
+    def first(self, formula: str = None, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        where, params = self._convert_formula_to_sql(formula)
+        if self._cache is not None:
+            cache_key = ('formula', where, tuple(params), tuple(fields) if fields else None)
+            hit, record, generation = self._cache.lookup(cache_key)
+            if hit:
+                return record
+        with pooled_connection() as conn:
             cursor = conn.cursor()
-            where, params = self._convert_formula_to_sql(formula)
-            cursor.execute(f"SELECT * FROM {self.table_name} WHERE {where} LIMIT 1", params)
-            row = cursor.fetchone()
-            return self._row_to_dict(row)
-        finally:
-            conn.close()
+            self._execute(cursor, f"SELECT {self._select_list(fields)} FROM {self.table_name} WHERE {where} LIMIT 1", params)
+            record = self._row_to_dict(cursor.fetchone())
+        if self._cache is not None:
+            self._cache.store(cache_key, record, generation)
+        return record
     
-    def all(self, formula: str = None) -> List[Dict]:
-        conn = get_connection()
-        try:
+    def _indexes(self) -> Dict[str, IndexInfo]:
+        """Indeksy tabeli: nazwa -> IndexInfo (kolumny w kolejności klucza, UNIQUE, częściowy) - odczytane raz na bazę."""
+        key = (DB_PATH, self.table_name)
+        indexes = _table_indexes.get(key)
+        if indexes is None:
+            indexes = {}
+            with pooled_connection() as conn:
+                for index in conn.execute(f"PRAGMA index_list({self.table_name})").fetchall():
+                    info = conn.execute(f"PRAGMA index_info({_quote_column(index['name'])})").fetchall()
+                    columns = tuple(row['name'] for row in sorted(info, key=lambda row: row['seqno']))
+                    if columns and all(columns):
+                        indexes[index['name']] = IndexInfo(columns, bool(index['unique']), bool(index['partial']))
+            _table_indexes[key] = indexes
+        return indexes
+
+    def _covering_index(self, unique_field: str, fields: Optional[List[str]]) -> Optional[str]:
+        """
+        Indeks zaczynający się od unique_field, który zawiera wszystkie żądane pola.
+        Nigdy częściowy: INDEXED BY indeksu z WHERE, którego warunek nie wynika z zapytania, kończy się błędem.
+        """
+        if not fields:
+            return None
+        wanted = set(fields) - {'id'}
+        for name, index in self._indexes().items():
+            if not index.partial and index.columns[0] == unique_field and wanted <= set(index.columns):
+                return name
+        return None
+
+    def get_by(self, unique_field: str, value: Any, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """
+        Rekord o danej wartości kolumny indeksowanej (np. ManagementToken, ClientID, TutorID, TeamsLink).
+        Bez parsowania formuły: stałe zapytanie z parametrem, które sqlite3 trzyma w cache
+        przygotowanych poleceń. Kolumna musi otwierać indeks, który nie jest częściowy - inaczej ValueError.
+        Przy indeksie bez UNIQUE (np. TeamsLink) zwraca pierwszy pasujący rekord, tak jak first().
+        Gdy fields mieszczą się w indeksie pokrywającym (np. ManagementToken -> Status, Oplacona),
+        odczyt nie sięga do tabeli - planer sam wybrałby indeks UNIQUE, więc wskazujemy go przez INDEXED BY.
+        """
+        if unique_field != 'id' and not any(not index.partial and index.columns[0] == unique_field
+                                            for index in self._indexes().values()):
+            raise ValueError(f"Kolumna {unique_field} tabeli {self.table_name} nie ma indeksu - użyj first()")
+        where = f"{_quote_column(unique_field)} = ?"
+        if self._cache is not None:
+            cache_key = ('formula', where, (value,), tuple(fields) if fields else None)
+            hit, record, generation = self._cache.lookup(cache_key)
+            if hit:
+                return record
+        source = self.table_name
+        covering = self._covering_index(unique_field, fields)
+        if covering is not None:
+            source += f" INDEXED BY {_quote_column(covering)}"
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, f"SELECT {self._select_list(fields)} FROM {source} WHERE {where} LIMIT 1", [value])
+            record = self._row_to_dict(cursor.fetchone())
+        if self._cache is not None:
+            self._cache.store(cache_key, record, generation)
+        return record
+
+    def all(self, formula: str = None, fields: Optional[List[str]] = None) -> List[Dict]:
+        with pooled_connection() as conn:
             cursor = conn.cursor()
             where, params = self._convert_formula_to_sql(formula)
-            cursor.execute(f"SELECT * FROM {self.table_name} WHERE {where}", params)
+            self._execute(cursor, f"SELECT {self._select_list(fields)} FROM {self.table_name} WHERE {where}", params)
             rows = cursor.fetchall()
-            results = [self._row_to_dict(row) for row in rows]
-            # Dodatkowe filtrowanie dat w Pythonie
-            if formula and ('IS_AFTER' in formula or 'IS_BEFORE' in formula or 'OR' in formula or 'NOT' in formula):
-                 return self._filter_complex_formula(results, formula)
-            return results
-        finally:
-            conn.close()
+            return self._rows_to_dicts(cursor, rows)
 
-    def _filter_complex_formula(self, records, formula):
-        # Prosta implementacja filtra pythonowego dla logiki której nie obsłużył SQL
-        filtered = []
-        for record in records:
-            fields = record['fields']
-            keep = True
-            # Tutaj logika filtrów data/status... (skrótowo)
-            filtered.append(record) 
-        return filtered
-
-    def get(self, record_id: str) -> Optional[Dict]:
-        conn = get_connection()
-        try:
+    def starting_between(self, start, end=None, formula: str = None, fields: Optional[List[str]] = None,
+                         limit: Optional[int] = None) -> List[Dict]:
+        """
+        Rezerwacje zaczynające się w [start, end) (bez end - wszystkie od start), posortowane po początku.
+        start/end: datetime (bez strefy = Europe/Warsaw), czas uniksowy albo tekst 'YYYY-MM-DD[ HH:MM]'.
+        Zakres idzie po indeksie kolumny start_ts; formula zawęża wynik.
+        """
+        if self.table_name not in START_TS_TABLES:
+            raise ValueError(f"Tabela {self.table_name} nie ma kolumny {START_TS_COLUMN}")
+        where, params = self._convert_formula_to_sql(formula)
+        conditions, range_params = [f"{START_TS_COLUMN} >= ?"], [_as_timestamp(start)]
+        if end is not None:
+            conditions.append(f"{START_TS_COLUMN} < ?")
+            range_params.append(_as_timestamp(end))
+        query = (f"SELECT {self._select_list(fields)} FROM {self.table_name} "
+                 f"WHERE {' AND '.join(conditions)} AND ({where}) ORDER BY {START_TS_COLUMN}, id")
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        with pooled_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {self.table_name} WHERE id = ?", [record_id])
-            row = cursor.fetchone()
-            return self._row_to_dict(row)
-        finally:
-            conn.close()
+            self._execute(cursor, query, range_params + params)
+            return self._rows_to_dicts(cursor, cursor.fetchall())
+
+    def upcoming(self, hours: Optional[float] = None, formula: str = None, fields: Optional[List[str]] = None,
+                 limit: Optional[int] = None, now: Optional[datetime] = None) -> List[Dict]:
+        """Nadchodzące lekcje: od teraz (lub now) do teraz + hours godzin; bez hours - wszystkie przyszłe."""
+        start = now or datetime.now(LOCAL_TIMEZONE)
+        end = _as_timestamp(start) + int(hours * 3600) if hours is not None else None
+        return self.starting_between(start, end, formula, fields, limit)
+
+    def _aggregate_sql(self, function: str, field: Optional[str]) -> str:
+        function = function.lower()
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Nieobsługiwana funkcja agregująca: {function!r} (dozwolone: {', '.join(AGGREGATE_FUNCTIONS)})")
+        if field is None:
+            if function != 'count':
+                raise ValueError(f"Funkcja {function} wymaga nazwy pola")
+            return "COUNT(*)"
+        sql = f"{function.upper()}({_quote_column(field)})"
+        # SUM po pustym zbiorze daje NULL - dla liczników i limitów wygodniejsze jest 0
+        return f"COALESCE({sql}, 0)" if function == 'sum' else sql
+
+    def count(self, formula: str = None) -> int:
+        """Liczba rekordów spełniających formułę (SELECT COUNT(*))."""
+        return self._scalar(self._aggregate_sql('count', None), formula)
+
+    def sum(self, field: str, formula: str = None):
+        """Suma pola po rekordach spełniających formułę; 0, gdy nie ma rekordów."""
+        return self._scalar(self._aggregate_sql('sum', field), formula)
+
+    def _scalar(self, expression: str, formula: str = None):
+        where, params = self._convert_formula_to_sql(formula)
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, f"SELECT {expression} FROM {self.table_name} WHERE {where}", params)
+            return cursor.fetchone()[0]
+
+    def group_by(self, fields: List[str], aggregates: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+                 formula: str = None) -> List[Dict[str, Any]]:
+        """
+        Agregacja po grupach, np. liczba rezerwacji per korepetytor:
+            group_by(['Korepetytor'], {'liczba': ('count', None)}, formula)
+        aggregates: nazwa wyniku -> (funkcja, pole); funkcje: count, sum, min, max, avg.
+        Zwraca listę słowników {pole grupujące..., nazwa wyniku...} posortowaną po polach grupujących.
+        """
+        if not fields:
+            raise ValueError("group_by wymaga co najmniej jednego pola grupującego")
+        aggregates = aggregates or {'count': ('count', None)}
+        group_columns = ', '.join(_quote_column(name) for name in fields)
+        select = [group_columns] + [f"{self._aggregate_sql(function, field)} AS {_quote_column(name)}"
+                                    for name, (function, field) in aggregates.items()]
+        where, params = self._convert_formula_to_sql(formula)
+        query = f"SELECT {', '.join(select)} FROM {self.table_name} WHERE {where} GROUP BY {group_columns} ORDER BY {group_columns}"
+        decoders = [self._codec.decoders.get(name) for name in fields]
+        names = list(fields) + list(aggregates)
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, query, params)
+            rows = cursor.fetchall()
+        result = []
+        for row in rows:
+            values = list(row)
+            for index, decoder in enumerate(decoders):
+                if decoder is not None:
+                    values[index] = decoder(values[index])
+            result.append(dict(zip(names, values)))
+        return result
+
+    def _fetch_page(self, formula: str, after_id: int, limit: int, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Jedna strona stronicowania kluczem (id > after_id) - połączenie wraca do puli od razu."""
+        where, params = self._convert_formula_to_sql(formula)
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            query = f"SELECT {self._select_list(fields)} FROM {self.table_name} WHERE ({where}) AND id > ? ORDER BY id LIMIT ?"
+            self._execute(cursor, query, params + [after_id, limit])
+            return self._rows_to_dicts(cursor, cursor.fetchmany(limit))
+
+    def iterate(self, formula: str = None, page_size: int = ITERATE_PAGE_SIZE,
+                fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Generator rekordów spełniających formułę, pobieranych stronami po page_size.
+        W pamięci jest najwyżej jedna strona, niezależnie od rozmiaru tabeli.
+        """
+        after_id = 0
+        while True:
+            records = self._fetch_page(formula, after_id, page_size, fields)
+            if not records:
+                return
+            after_id = int(records[-1]['id'])
+            yield from records
+            if len(records) < page_size:
+                return
+
+    def page(self, formula: str = None, after_id: Optional[str] = None, limit: int = 100,
+             fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Strona wyników dla API: zwraca (rekordy, kursor_następnej_strony).
+        Kursor to id ostatniego rekordu; None oznacza koniec wyników.
+        """
+        records = self._fetch_page(formula, int(after_id) if after_id else 0, limit + 1, fields)
+        has_more = len(records) > limit
+        records = records[:limit]
+        next_after_id = records[-1]['id'] if has_more else None
+        return records, next_after_id
+
+    def get(self, record_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        if self._cache is not None:
+            cache_key = ('id', str(record_id), tuple(fields) if fields else None)
+            hit, record, generation = self._cache.lookup(cache_key)
+            if hit:
+                return record
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            self._execute(cursor, f"SELECT {self._select_list(fields)} FROM {self.table_name} WHERE id = ?", [record_id])
+            record = self._row_to_dict(cursor.fetchone())
+        if self._cache is not None:
+            self._cache.store(cache_key, record, generation)
+        return record
+
+    def _delete_job(self, record_id: str):
+        def job(conn):
+            self._execute(conn.cursor(), f"DELETE FROM {self.table_name} WHERE id = ?", [record_id])
+            return None, self._after_write('delete', [str(record_id)])
+        return job
 
     def delete(self, record_id: str) -> None:
-        conn = get_connection()
-        try:
+        self._run_write(self._delete_job(record_id))
+
+    def delete_async(self, record_id: str) -> Future:
+        """Jak delete, ale przez wątek zapisujący."""
+        return self._submit(self._delete_job(record_id))
+
+    def _fetch_by_ids(self, cursor, record_ids: List[str]) -> Dict[str, Dict]:
+        """Pobiera rekordy po id porcjami po BATCH_CHUNK_SIZE; zwraca słownik id -> rekord."""
+        records = {}
+        for i in range(0, len(record_ids), BATCH_CHUNK_SIZE):
+            chunk = record_ids[i:i + BATCH_CHUNK_SIZE]
+            placeholders = ', '.join(['?' for _ in chunk])
+            self._execute(cursor, f"SELECT * FROM {self.table_name} WHERE id IN ({placeholders})", chunk)
+            for record in self._rows_to_dicts(cursor, cursor.fetchall()):
+                records[record['id']] = record
+        return records
+
+    def _group_by_columns(self, items):
+        """Grupuje (pozycja, pola) według zestawu kolumn, żeby każda grupa była jednym executemany."""
+        groups = {}
+        for position, fields in items:
+            prepared_fields = self._prepare_fields_for_write(fields)
+            groups.setdefault(tuple(prepared_fields.keys()), []).append((position, prepared_fields))
+        return groups
+
+    def _batch_create_job(self, records: List[Dict[str, Any]]):
+        groups = self._group_by_columns(enumerate(records))
+        written_columns = {name for record in records for name in record}
+        count = len(records)
+
+        def job(conn):
+            # Transakcja jest IMMEDIATE (blokada zapisu od początku), więc id w obrębie grupy są kolejne
+            created_ids = [None] * count
             cursor = conn.cursor()
-            cursor.execute(f"DELETE FROM {self.table_name} WHERE id = ?", [record_id])
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+            for columns, group in groups.items():
+                if columns:
+                    placeholders = ', '.join(['?' for _ in columns])
+                    query = f"INSERT INTO {self.table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                else:
+                    query = f"INSERT INTO {self.table_name} DEFAULT VALUES"
+                if EXPLAIN_QUERY_PLAN:
+                    _log_query_plan(conn, query, list(group[0][1].values()))
+                if 'id' in columns:
+                    # Jawne id nie muszą być kolejne ani rosnące - id każdego wiersza odczytywane osobno
+                    for position, fields in group:
+                        cursor.execute(query, list(fields.values()))
+                        created_ids[position] = str(cursor.lastrowid)
+                    continue
+                cursor.executemany(query, [list(fields.values()) for _, fields in group])
+                last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+                first_id = last_id - len(group) + 1
+                for offset, (position, _) in enumerate(group):
+                    created_ids[position] = str(first_id + offset)
+            by_id = self._fetch_by_ids(cursor, created_ids)
+            return [by_id[record_id] for record_id in created_ids], self._after_write('create', created_ids, written_columns)
+        return job
+
+    def batch_create(self, records: List[Dict[str, Any]]) -> List[Dict]:
+        """Tworzy wiele rekordów (listę słowników pól) w jednej transakcji; w trybie write-behind zwraca None."""
+        if not records:
+            return []
+        return self._run_write(self._batch_create_job(records))
+
+    def batch_create_async(self, records: List[Dict[str, Any]]) -> Future:
+        """Jak batch_create, ale przez wątek zapisujący; zwraca Future z listą rekordów."""
+        return self._submit(self._batch_create_job(records))
+
+    def _batch_update_job(self, records: List[Dict]):
+        record_ids = [str(record['id']) for record in records]
+        groups = self._group_by_columns((record_ids[i], record['fields']) for i, record in enumerate(records))
+        written_columns = {name for record in records for name in record['fields']}
+
+        def job(conn):
+            cursor = conn.cursor()
+            for columns, group in groups.items():
+                if not columns:
+                    continue
+                set_clause = ', '.join([f"{k} = ?" for k in columns])
+                query = f"UPDATE {self.table_name} SET {set_clause} WHERE id = ?"
+                if EXPLAIN_QUERY_PLAN:
+                    _log_query_plan(conn, query, list(group[0][1].values()) + [group[0][0]])
+                cursor.executemany(query, [list(fields.values()) + [record_id] for record_id, fields in group])
+                self._sync_derived(cursor, columns, [record_id for record_id, _ in group])
+            by_id = self._fetch_by_ids(cursor, list(dict.fromkeys(record_ids)))
+            updated = [by_id[record_id] for record_id in record_ids if record_id in by_id]
+            return updated, self._after_write('update', record_ids, written_columns)
+        return job
+
+    def batch_update(self, records: List[Dict]) -> List[Dict]:
+        """Aktualizuje wiele rekordów ({'id', 'fields'}) w jednej transakcji; zwraca je po zapisie (write-behind: None)."""
+        if not records:
+            return []
+        return self._run_write(self._batch_update_job(records))
+
+    def batch_update_async(self, records: List[Dict]) -> Future:
+        """Jak batch_update, ale przez wątek zapisujący; zwraca Future z listą rekordów."""
+        return self._submit(self._batch_update_job(records))
+
+    def _batch_delete_job(self, record_ids: List[str]):
+        def job(conn):
+            if not record_ids:
+                return None, None
+            query = f"DELETE FROM {self.table_name} WHERE id = ?"
+            if EXPLAIN_QUERY_PLAN:
+                _log_query_plan(conn, query, [str(record_ids[0])])
+            conn.executemany(query, [[str(record_id)] for record_id in record_ids])
+            return None, self._after_write('delete', [str(record_id) for record_id in record_ids])
+        return job
+
+    def batch_delete(self, record_ids: List[str]) -> None:
+        """Usuwa wiele rekordów w jednej transakcji."""
+        if not record_ids:
+            return
+        self._run_write(self._batch_delete_job(record_ids))
 
-    def batch_update(self, records: List[Dict]) -> None:
-        for record in records:
-            self.update(record['id'], record['fields'])
+    def batch_delete_async(self, record_ids: List[str]) -> Future:
+        """Jak batch_delete, ale przez wątek zapisujący."""
+        return self._submit(self._batch_delete_job(record_ids))
 
 if __name__ == '__main__':
     init_database()
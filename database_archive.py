@@ -0,0 +1,72 @@
+"""
+Archiwizacja starych rezerwacji.
+
+Rezerwacje z datą starszą niż N dni są przenoszone porcjami z tabeli Rezerwacje
+do RezerwacjeArchiwum (ta sama baza, id zachowane). Tabela główna i jej indeksy
+zostają małe, a zapytania historyczne idą przez widok RezerwacjeWszystkie:
+
+    DatabaseTable(RESERVATION_HISTORY_VIEW).all("{Klient} = 'psid'")
+
+Uruchom: python database_archive.py [dni]
+"""
+import sys
+from datetime import date as date_type, timedelta
+from typing import Optional
+
+import database
+from database import DatabaseTable, BATCH_CHUNK_SIZE, RESERVATION_ARCHIVE_TABLE, pooled_connection
+
+# Domyślnie archiwizujemy rezerwacje starsze niż pół roku
+ARCHIVE_AFTER_DAYS = 180
+
+def _sync_archive_columns(conn) -> list:
+    """
+    Kolumny do przeniesienia: wszystkie kolumny Rezerwacje.
+    Kolumny dodane do Rezerwacje poza migracjami (np. przez backend) są dopisywane do archiwum,
+    żeby archiwizacja niczego nie gubiła.
+    """
+    hot = [(row['name'], row['type']) for row in conn.execute("PRAGMA table_info(Rezerwacje)")]
+    archived = {row['name'] for row in conn.execute(f"PRAGMA table_info({RESERVATION_ARCHIVE_TABLE})")}
+    for name, column_type in hot:
+        if name not in archived:
+            print(f"Archiwum: Dodawanie kolumny {name} do tabeli {RESERVATION_ARCHIVE_TABLE}...")
+            conn.execute(f'ALTER TABLE {RESERVATION_ARCHIVE_TABLE} ADD COLUMN "{name}" {column_type}')
+    return [name for name, _ in hot]
+
+def archive_reservations(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_CHUNK_SIZE,
+                         today: Optional[date_type] = None) -> int:
+    """
+    Przenosi rezerwacje z Data starszą niż older_than_days do archiwum, po batch_size w transakcji
+    (krótkie blokady zapisu - bot i backend mogą pisać między porcjami). Zwraca liczbę przeniesionych.
+    """
+    cutoff = ((today or date_type.today()) - timedelta(days=older_than_days)).isoformat()
+    reservations = DatabaseTable('Rezerwacje')
+    with pooled_connection() as conn:
+        columns = ', '.join(f'"{name}"' for name in _sync_archive_columns(conn))
+        conn.commit()
+
+    def move_batch(conn):
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM Rezerwacje WHERE Data < ? ORDER BY Data LIMIT ?", [cutoff, batch_size])]
+        if not ids:
+            return 0, None
+        placeholders = ', '.join(['?' for _ in ids])
+        conn.execute(f"INSERT OR REPLACE INTO {RESERVATION_ARCHIVE_TABLE} ({columns}) "
+                     f"SELECT {columns} FROM Rezerwacje WHERE id IN ({placeholders})", ids)
+        conn.execute(f"DELETE FROM Rezerwacje WHERE id IN ({placeholders})", ids)
+        # Dla słuchaczy (cache, silnik terminów) rekordy znikają z Rezerwacje
+        return len(ids), reservations._after_write('delete', [str(record_id) for record_id in ids])
+
+    moved = 0
+    while True:
+        count = reservations._run_write(move_batch)
+        if not count:
+            break
+        moved += count
+    return moved
+
+if __name__ == '__main__':
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    database.init_database()
+    moved = archive_reservations(days)
+    print(f"Archiwum: przeniesiono {moved} rezerwacji starszych niż {days} dni do {RESERVATION_ARCHIVE_TABLE}.")
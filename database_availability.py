@@ -0,0 +1,725 @@
+"""
+Wyszukiwanie wolnych korepetytorów i terminów.
+Korzysta z tabeli TutorAvailability, którą triggery utrzymują w zgodzie
+z kolumnami dni (Poniedziałek ... Niedziela) tabeli Korepetytorzy.
+"""
+import sqlite3
+import threading
+import time
+from datetime import date as date_type, datetime, timedelta
+from typing import Optional, List, Dict, Tuple, Union, Iterator, NamedTuple
+
+import database
+from database import (DatabaseTable, WEEKDAY_COLUMNS, pooled_connection, TableVersionWatch, _minutes_sql,
+                      add_write_listener, remove_write_listener)
+
+# Statusy rezerwacji, które nie blokują terminu
+INACTIVE_RESERVATION_STATUSES = ('Anulowana', 'Odwołana')
+
+def _json_contains_sql(column: str) -> str:
+    """Warunek 'lista JSON w kolumnie zawiera ?' - zwykły tekst traktowany jak lista jednoelementowa."""
+    return (f"EXISTS (SELECT 1 FROM json_each(CASE WHEN json_valid({column}) THEN {column} "
+            f"ELSE json_array({column}) END) WHERE value = ?)")
+
+def _parse_minutes(hour: str) -> int:
+    hours, minutes = hour.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+def _weekday_index(day: Union[int, str]) -> int:
+    if isinstance(day, int):
+        return day
+    return WEEKDAY_COLUMNS.index(day)
+
+def find_free_tutors(subject: Optional[str], level: Optional[str], hour: str,
+                     day: Union[int, str, None] = None, date: Union[str, date_type, None] = None,
+                     duration: int = 60, fields: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Korepetytorzy uczący przedmiotu `subject` na poziomie `level`, dostępni o godzinie
+    `hour` ('HH:MM') przez `duration` minut, jednym zapytaniem po indeksie dostępności.
+
+    day: indeks dnia (0 = poniedziałek) albo nazwa kolumny, np. 'Wtorek'.
+    date: konkretny dzień ('YYYY-MM-DD'); wtedy dzień tygodnia wynika z daty, a korepetytorzy
+          z rezerwacją lub aktywną stałą rezerwacją w tym terminie są pomijani.
+    Zwraca rekordy Korepetytorzy w formacie Airtable.
+    """
+    if date is not None and not isinstance(date, date_type):
+        date = datetime.strptime(date, '%Y-%m-%d').date()
+    if day is None:
+        if date is None:
+            raise ValueError("Podaj day albo date")
+        day = date.weekday()
+    day_index = _weekday_index(day)
+    start = _parse_minutes(hour)
+
+    conditions = [
+        "k.TutorID IN (SELECT a.TutorID FROM TutorAvailability a"
+        " WHERE a.DzienTygodnia = ? AND a.Od <= ? AND a.Do >= ?)"
+    ]
+    params = [day_index, start, start + duration]
+    if subject:
+        conditions.append(_json_contains_sql('k.Przedmioty'))
+        params.append(subject)
+    if level:
+        conditions.append(_json_contains_sql('k.PoziomNauczania'))
+        params.append(level)
+    if date is not None:
+        # Konflikt to nachodzenie przedziałów [start, start + duration) i [Godzina, Godzina + LESSON_MINUTES),
+        # nie tylko ta sama godzina startu (08:00 blokuje też 08:30)
+        status_placeholders = ', '.join(['?' for _ in INACTIVE_RESERVATION_STATUSES])
+        conditions.append(
+            "NOT EXISTS (SELECT 1 FROM Rezerwacje r WHERE r.Korepetytor = k.ImieNazwisko AND r.Data = ?"
+            f" AND {_minutes_sql('r.Godzina')} < ? AND {_minutes_sql('r.Godzina')} + ? > ?"
+            f" AND COALESCE(r.Status, '') NOT IN ({status_placeholders}))"
+        )
+        params += [date.isoformat(), start + duration, LESSON_MINUTES, start] + list(INACTIVE_RESERVATION_STATUSES)
+        conditions.append(
+            "NOT EXISTS (SELECT 1 FROM StaleRezerwacje s WHERE s.Korepetytor = k.ImieNazwisko"
+            f" AND s.DzienTygodnia = ? AND {_minutes_sql('s.Godzina')} < ? AND {_minutes_sql('s.Godzina')} + ? > ?"
+            " AND s.Aktywna = 1)"
+        )
+        params += [WEEKDAY_COLUMNS[day_index], start + duration, LESSON_MINUTES, start]
+
+    tutors = DatabaseTable('Korepetytorzy')
+    query = f"SELECT {tutors._select_list(fields, alias='k')} FROM Korepetytorzy k WHERE {' AND '.join(conditions)} ORDER BY k.id"
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        tutors._execute(cursor, query, params)
+        return tutors._rows_to_dicts(cursor, cursor.fetchall())
+
+# ------------------------------------------------------------
+# Tygodniowy silnik wolnych terminów (maski bitowe)
+# ------------------------------------------------------------
+
+# Rozdzielczość siatki terminów i długość lekcji
+SLOT_MINUTES = 30
+LESSON_MINUTES = 60
+
+class _WeekReservations:
+    """Warstwa jednorazowych rezerwacji jednego tygodnia: ImieNazwisko -> maska zajętości i liczba lekcji."""
+    __slots__ = ('busy', 'lessons', 'dirty', 'stale')
+
+    def __init__(self):
+        self.busy = {}
+        self.lessons = {}
+        self.dirty = set()   # korepetytorzy do przeładowania pojedynczo
+        self.stale = False   # cała warstwa do przeładowania
+
+class WeeklySlotEngine:
+    """
+    Wolne terminy wszystkich korepetytorów w tygodniu, liczone na maskach bitowych.
+
+    Tydzień to jedna liczba całkowita: bit (dzień * slots_per_day + slot) oznacza
+    SLOT_MINUTES-minutowy fragment doby. Dostępność, stałe rezerwacje i jednorazowe
+    rezerwacje tygodnia są ładowane hurtowo (po jednym zapytaniu na warstwę), a wolne
+    starty lekcji to AND/NOT na maskach - bez pętli po godzinach.
+
+    Unieważnianie jest przyrostowe: zmiana rezerwacji przez DatabaseTable w tym procesie
+    przeładowuje tylko danego korepetytora w danym tygodniu; zmiana stałych rezerwacji lub
+    korepetytorów przeładowuje jedynie swoją (małą) warstwę. Przed każdym zapytaniem
+    TableVersionWatch sprawdza też zapisy spoza słuchaczy tego procesu (np. backendu) -
+    tylko taka, niewyjaśniona zmiana tabeli unieważnia całą jej warstwę.
+    """
+
+    def __init__(self, slot_minutes: int = SLOT_MINUTES, lesson_minutes: int = LESSON_MINUTES):
+        if lesson_minutes % slot_minutes:
+            raise ValueError("lesson_minutes musi być wielokrotnością slot_minutes")
+        self.slot_minutes = slot_minutes
+        self.lesson_slots = lesson_minutes // slot_minutes
+        self.slots_per_day = 24 * 60 // slot_minutes
+        day_starts = (1 << (self.slots_per_day - self.lesson_slots + 1)) - 1
+        # Starty, po których lekcja mieści się w tej samej dobie
+        self._valid_starts = sum(day_starts << (day * self.slots_per_day) for day in range(7))
+        self._lock = threading.RLock()
+        self._tutors = None           # TutorID -> (ImieNazwisko, LimitGodzinTygodniowo)
+        self._availability = None     # TutorID -> maska tygodnia
+        self._recurring = None        # ImieNazwisko -> (maska, liczba lekcji)
+        self._weeks = {}              # poniedziałek -> _WeekReservations
+        self._watch = TableVersionWatch(('Korepetytorzy', 'StaleRezerwacje', 'Rezerwacje'))
+        self._attached = False
+        # Liczniki ładowań rezerwacji tygodnia: całego tygodnia / pojedynczego korepetytora
+        self.week_loads = 0
+        self.tutor_loads = 0
+
+    # --- Maski ---
+
+    def _lesson_mask(self, day_index: int, hour: str) -> int:
+        slot = _parse_minutes(hour) // self.slot_minutes
+        return ((1 << self.lesson_slots) - 1) << (day_index * self.slots_per_day + slot)
+
+    def _interval_mask(self, day_index: int, start: int, end: int) -> int:
+        first = -(-start // self.slot_minutes)
+        last = min(end // self.slot_minutes, self.slots_per_day)
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << (day_index * self.slots_per_day + first)
+
+    # --- Ładowanie warstw ---
+
+    def _load_tutors(self, conn):
+        tutors, availability = {}, {}
+        for row in conn.execute("SELECT TutorID, ImieNazwisko, LimitGodzinTygodniowo FROM Korepetytorzy"):
+            limit = row['LimitGodzinTygodniowo']
+            tutors[row['TutorID']] = (row['ImieNazwisko'], None if limit in (None, '') else int(limit))
+            availability[row['TutorID']] = 0
+        for row in conn.execute("SELECT TutorID, DzienTygodnia, Od, Do FROM TutorAvailability"):
+            if row['TutorID'] in availability:
+                availability[row['TutorID']] |= self._interval_mask(row['DzienTygodnia'], row['Od'], row['Do'])
+        self._tutors, self._availability = tutors, availability
+
+    def _load_recurring(self, conn):
+        recurring = {}
+        for row in conn.execute("SELECT Korepetytor, DzienTygodnia, Godzina FROM StaleRezerwacje WHERE Aktywna = 1"):
+            if row['DzienTygodnia'] not in WEEKDAY_COLUMNS:
+                continue
+            mask, lessons = recurring.get(row['Korepetytor'], (0, 0))
+            mask |= self._lesson_mask(WEEKDAY_COLUMNS.index(row['DzienTygodnia']), row['Godzina'])
+            recurring[row['Korepetytor']] = (mask, lessons + 1)
+        self._recurring = recurring
+
+    def _reservation_rows(self, conn, week_start: date_type, tutor_name: Optional[str] = None):
+        week_end = week_start + timedelta(days=7)
+        status_placeholders = ', '.join(['?' for _ in INACTIVE_RESERVATION_STATUSES])
+        query = (f"SELECT Korepetytor, Data, Godzina FROM Rezerwacje WHERE Data >= ? AND Data < ?"
+                 f" AND COALESCE(Status, '') NOT IN ({status_placeholders})")
+        params = [week_start.isoformat(), week_end.isoformat()] + list(INACTIVE_RESERVATION_STATUSES)
+        if tutor_name is not None:
+            query += " AND Korepetytor = ?"
+            params.append(tutor_name)
+        return conn.execute(query, params)
+
+    def _apply_reservation(self, week: _WeekReservations, week_start: date_type, row):
+        try:
+            day_index = (date_type.fromisoformat(row['Data']) - week_start).days
+            mask = self._lesson_mask(day_index, row['Godzina'])
+        except (TypeError, ValueError):
+            return # Uszkodzona data/godzina - nie blokuje siatki
+        name = row['Korepetytor']
+        week.busy[name] = week.busy.get(name, 0) | mask
+        week.lessons[name] = week.lessons.get(name, 0) + 1
+
+    def _load_week(self, conn, week_start: date_type) -> _WeekReservations:
+        week = self._weeks.get(week_start)
+        if week is None or week.stale:
+            week = _WeekReservations()
+            for row in self._reservation_rows(conn, week_start):
+                self._apply_reservation(week, week_start, row)
+            self._weeks[week_start] = week
+            self.week_loads += 1
+        elif week.dirty:
+            for name in week.dirty:
+                week.busy.pop(name, None)
+                week.lessons.pop(name, None)
+                for row in self._reservation_rows(conn, week_start, name):
+                    self._apply_reservation(week, week_start, row)
+                self.tutor_loads += 1
+            week.dirty.clear()
+        return week
+
+    def _apply_external_changes(self):
+        # Zapisy DatabaseTable z tego procesu są wyjaśnione (attach) - obsłużyły je już słuchacze zapisów
+        changed = self._watch.changed()
+        if 'Korepetytorzy' in changed:
+            self.invalidate_tutors()
+        if 'StaleRezerwacje' in changed:
+            self.invalidate_recurring()
+        if 'Rezerwacje' in changed:
+            self.invalidate_reservations()
+
+    def _ensure_loaded(self, week_starts):
+        self._apply_external_changes()
+        with pooled_connection() as conn:
+            if self._tutors is None:
+                self._load_tutors(conn)
+            if self._recurring is None:
+                self._load_recurring(conn)
+            return [self._load_week(conn, week_start) for week_start in week_starts]
+
+    # --- Zapytania ---
+
+    @staticmethod
+    def week_start(day: Union[str, date_type]) -> date_type:
+        """Poniedziałek tygodnia, do którego należy data."""
+        if not isinstance(day, date_type):
+            day = date_type.fromisoformat(day)
+        return day - timedelta(days=day.weekday())
+
+    def free_masks(self, week_start: Union[str, date_type]) -> Dict[str, int]:
+        """TutorID -> maska startów lekcji, które można zarezerwować w tygodniu."""
+        return self.free_masks_for_weeks([week_start])[0]
+
+    def free_masks_for_weeks(self, week_starts) -> List[Dict[str, int]]:
+        week_starts = [self.week_start(w) for w in week_starts]
+        with self._lock:
+            weeks = self._ensure_loaded(week_starts)
+            results = []
+            for week in weeks:
+                masks = {}
+                for tutor_id, (name, limit) in self._tutors.items():
+                    recurring_mask, recurring_lessons = self._recurring.get(name, (0, 0))
+                    if limit is not None:
+                        booked_minutes = (week.lessons.get(name, 0) + recurring_lessons) * self.lesson_slots * self.slot_minutes
+                        if booked_minutes >= limit * 60:
+                            masks[tutor_id] = 0
+                            continue
+                    free = self._availability[tutor_id] & ~(recurring_mask | week.busy.get(name, 0))
+                    starts = free & self._valid_starts
+                    for offset in range(1, self.lesson_slots):
+                        starts &= free >> offset
+                    masks[tutor_id] = starts
+                results.append(masks)
+            return results
+
+    def mask_to_slots(self, week_start: Union[str, date_type], mask: int) -> List[Tuple[date_type, str]]:
+        """Rozwija maskę startów na listę (data, 'HH:MM')."""
+        week_start = self.week_start(week_start)
+        slots = []
+        while mask:
+            lowest = mask & -mask
+            index = lowest.bit_length() - 1
+            day_index, slot = divmod(index, self.slots_per_day)
+            minutes = slot * self.slot_minutes
+            slots.append((week_start + timedelta(days=day_index), f"{minutes // 60:02d}:{minutes % 60:02d}"))
+            mask ^= lowest
+        return slots
+
+    def free_slots(self, week_start: Union[str, date_type]) -> Dict[str, List[Tuple[date_type, str]]]:
+        """TutorID -> lista wolnych startów lekcji (data, 'HH:MM') w tygodniu."""
+        week_start = self.week_start(week_start)
+        return {tutor_id: self.mask_to_slots(week_start, mask)
+                for tutor_id, mask in self.free_masks(week_start).items() if mask}
+
+    def tutors_free_at(self, day: Union[str, date_type], hour: str) -> List[str]:
+        """TutorID korepetytorów, u których można zarezerwować lekcję w danym terminie."""
+        if not isinstance(day, date_type):
+            day = date_type.fromisoformat(day)
+        bit = 1 << (day.weekday() * self.slots_per_day + _parse_minutes(hour) // self.slot_minutes)
+        return [tutor_id for tutor_id, mask in self.free_masks(day).items() if mask & bit]
+
+    # --- Unieważnianie ---
+
+    def reservation_changed(self, tutor_name: str, day: Union[str, date_type]) -> None:
+        """Przeładuj przy następnym zapytaniu tylko rezerwacje tego korepetytora w tym tygodniu."""
+        with self._lock:
+            week = self._weeks.get(self.week_start(day))
+            if week is not None:
+                week.dirty.add(tutor_name)
+
+    def invalidate_reservations(self) -> None:
+        with self._lock:
+            for week in self._weeks.values():
+                week.stale = True
+
+    def invalidate_recurring(self) -> None:
+        with self._lock:
+            self._recurring = None
+
+    def invalidate_tutors(self) -> None:
+        with self._lock:
+            self._tutors = None
+            self._availability = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._tutors = self._availability = self._recurring = None
+            self._weeks.clear()
+
+    # --- Powiązanie z zapisami DatabaseTable ---
+
+    def _on_reservation_write(self, action, record_ids, field_names):
+        if not self._weeks:
+            return
+        moved = 'Data' in field_names or 'Korepetytor' in field_names
+        if action == 'delete' or (action == 'update' and moved):
+            # Nie znamy poprzedniej daty/korepetytora - przeładuj warstwę rezerwacji
+            self.invalidate_reservations()
+            return
+        placeholders = ', '.join(['?' for _ in record_ids])
+        with pooled_connection() as conn:
+            rows = conn.execute(f"SELECT Korepetytor, Data FROM Rezerwacje WHERE id IN ({placeholders})", record_ids).fetchall()
+        for row in rows:
+            try:
+                self.reservation_changed(row['Korepetytor'], row['Data'])
+            except (TypeError, ValueError):
+                continue
+
+    def _on_recurring_write(self, action, record_ids, field_names):
+        self.invalidate_recurring()
+
+    def _on_tutor_write(self, action, record_ids, field_names):
+        self.invalidate_tutors()
+
+    def attach(self) -> 'WeeklySlotEngine':
+        """Podpina unieważnianie pod zapisy DatabaseTable w tym procesie."""
+        if not self._attached:
+            add_write_listener('Rezerwacje', self._on_reservation_write)
+            add_write_listener('StaleRezerwacje', self._on_recurring_write)
+            add_write_listener('Korepetytorzy', self._on_tutor_write)
+            self._watch.attach()
+            self._attached = True
+        return self
+
+    def detach(self) -> None:
+        if self._attached:
+            remove_write_listener('Rezerwacje', self._on_reservation_write)
+            remove_write_listener('StaleRezerwacje', self._on_recurring_write)
+            remove_write_listener('Korepetytorzy', self._on_tutor_write)
+            self._watch.detach()
+            self._attached = False
+
+_slot_engine = None
+_slot_engine_lock = threading.Lock()
+
+def get_slot_engine() -> WeeklySlotEngine:
+    """Współdzielony silnik terminów, podpięty pod zapisy DatabaseTable."""
+    global _slot_engine
+    with _slot_engine_lock:
+        if _slot_engine is None:
+            _slot_engine = WeeklySlotEngine().attach()
+        return _slot_engine
+
+# ------------------------------------------------------------
+# Limit godzin tygodniowo (LimitGodzinTygodniowo)
+# ------------------------------------------------------------
+
+class WeeklyLimitExceeded(ValueError):
+    """Rezerwacja przekroczyłaby tygodniowy limit godzin korepetytora."""
+
+def _weekly_load_query() -> str:
+    status_placeholders = ', '.join(['?' for _ in INACTIVE_RESERVATION_STATUSES])
+    # Oba podzapytania czytają wyłącznie indeksy pokrywające (idx_rezerwacje_tydzien, idx_stale_rezerwacje_termin)
+    return (
+        "SELECT k.LimitGodzinTygodniowo,"
+        " (SELECT COUNT(*) FROM Rezerwacje r WHERE r.Korepetytor = k.ImieNazwisko"
+        f"  AND r.Data >= ? AND r.Data < ? AND COALESCE(r.Status, '') NOT IN ({status_placeholders})),"
+        " (SELECT COUNT(*) FROM StaleRezerwacje s WHERE s.Korepetytor = k.ImieNazwisko AND s.Aktywna = 1)"
+        " FROM Korepetytorzy k WHERE k.ImieNazwisko = ? LIMIT 1"
+    )
+
+def weekly_load(conn, tutor_name: str, day: Union[str, date_type],
+                lesson_minutes: int = LESSON_MINUTES) -> Tuple[Optional[int], int]:
+    """
+    (LimitGodzinTygodniowo, zarezerwowane minuty) korepetytora w tygodniu ISO zawierającym `day`,
+    jednym zapytaniem. Liczą się jednorazowe rezerwacje tygodnia (poza anulowanymi)
+    i aktywne stałe rezerwacje - każda jako lekcja `lesson_minutes`.
+    Limit None oznacza brak limitu (albo nieznanego korepetytora).
+    """
+    week_start = WeeklySlotEngine.week_start(day)
+    week_end = week_start + timedelta(days=7)
+    params = [week_start.isoformat(), week_end.isoformat()] + list(INACTIVE_RESERVATION_STATUSES) + [tutor_name]
+    row = conn.execute(_weekly_load_query(), params).fetchone()
+    if row is None:
+        return None, 0
+    limit, one_off, recurring = row[0], row[1], row[2]
+    limit = None if limit in (None, '') else int(limit)
+    return limit, (one_off + recurring) * lesson_minutes
+
+def check_weekly_limit(conn, tutor_name: str, day: Union[str, date_type],
+                       lesson_minutes: int = LESSON_MINUTES) -> None:
+    """Rzuca WeeklyLimitExceeded, jeśli kolejna lekcja przekroczyłaby limit godzin w tygodniu."""
+    limit, booked_minutes = weekly_load(conn, tutor_name, day, lesson_minutes)
+    if limit is not None and booked_minutes + lesson_minutes > limit * 60:
+        raise WeeklyLimitExceeded(
+            f"Korepetytor {tutor_name} ma w tygodniu od {WeeklySlotEngine.week_start(day)} "
+            f"zarezerwowane {booked_minutes / 60:g} h z limitu {limit} h"
+        )
+
+def book_reservation(fields: Dict, lesson_minutes: int = LESSON_MINUTES) -> Dict:
+    """
+    Tworzy rezerwację, sprawdzając LimitGodzinTygodniowo w tej samej transakcji co INSERT.
+    Transakcja zapisu blokuje bazę od początku (BEGIN IMMEDIATE), więc równoległe rezerwacje
+    są sprawdzane po kolei i nie przekroczą limitu. Rzuca WeeklyLimitExceeded.
+    """
+    reservations = DatabaseTable('Rezerwacje')
+    create_job = reservations._create_job(fields, True)
+
+    def job(conn):
+        check_weekly_limit(conn, fields['Korepetytor'], fields['Data'], lesson_minutes)
+        return create_job(conn)
+    return reservations._run_write(job)
+
+# ------------------------------------------------------------
+# Wystąpienia stałych rezerwacji (StaleRezerwacje) w konkretnych datach
+# ------------------------------------------------------------
+
+# Ile rozwiniętych tygodni pamiętać na korepetytora (dwa lata widoków kalendarza)
+RECURRING_CACHE_WEEKS = 104
+
+class Occurrence(NamedTuple):
+    date: date_type
+    hour: str       # 'HH:MM'
+    tutor: str      # ImieNazwisko korepetytora
+    client: str     # Klient_ID
+
+class RecurringExpander:
+    """
+    Rozwija aktywne stałe rezerwacje (DzienTygodnia + Godzina) na konkretne terminy.
+
+    Wystąpienia są liczone leniwie, tydzień po tygodniu, i zapamiętywane per korepetytor
+    i tydzień - kolejne widoki kalendarza tego samego okresu nie przeliczają niczego.
+    Zmiana stałej rezerwacji (także przełączenie Aktywna) przez DatabaseTable
+    unieważnia tylko korepetytorów, których dotyczy; zapis StaleRezerwacje z innego
+    procesu (niewyjaśniony w TableVersionWatch) unieważnia wszystko.
+    """
+
+    def __init__(self, max_weeks: int = RECURRING_CACHE_WEEKS):
+        self.max_weeks = max_weeks
+        self._lock = threading.RLock()
+        self._rules = {}        # ImieNazwisko -> ((dzień, 'HH:MM', Klient_ID), ...)
+        self._complete = False  # czy _rules zawiera wszystkich korepetytorów
+        self._windows = {}      # ImieNazwisko -> {poniedziałek -> (Occurrence, ...)}
+        self._watch = TableVersionWatch(('StaleRezerwacje',))
+        self._attached = False
+        self.full_invalidations = 0  # przez zapisy spoza słuchaczy tego procesu
+
+    # --- Reguły ---
+
+    @staticmethod
+    def _rule(row):
+        try:
+            minutes = _parse_minutes(row['Godzina'])
+            day_index = WEEKDAY_COLUMNS.index(row['DzienTygodnia'])
+        except (AttributeError, ValueError):
+            return None # Uszkodzony wpis - pomijany, jak w silniku terminów
+        return (day_index, f"{minutes // 60:02d}:{minutes % 60:02d}", row['Klient_ID'])
+
+    def _query_rules(self, conn, tutor_name: Optional[str] = None) -> Dict[str, tuple]:
+        query = "SELECT Korepetytor, DzienTygodnia, Godzina, Klient_ID FROM StaleRezerwacje WHERE Aktywna = 1"
+        params = []
+        if tutor_name is not None:
+            query += " AND Korepetytor = ?"
+            params.append(tutor_name)
+        rules = {}
+        for row in conn.execute(query, params):
+            rule = self._rule(row)
+            if rule is not None:
+                rules.setdefault(row['Korepetytor'], []).append(rule)
+        return {name: tuple(sorted(tutor_rules)) for name, tutor_rules in rules.items()}
+
+    def _load_rules(self, tutor_name: Optional[str]) -> List[str]:
+        """Ładuje brakujące reguły; zwraca korepetytorów do rozwinięcia."""
+        if tutor_name is not None:
+            if tutor_name not in self._rules:
+                with pooled_connection() as conn:
+                    self._rules[tutor_name] = self._query_rules(conn, tutor_name).get(tutor_name, ())
+            return [tutor_name]
+        if not self._complete:
+            with pooled_connection() as conn:
+                fresh = self._query_rules(conn)
+            for name in set(self._rules) | set(fresh):
+                if self._rules.get(name, ()) != fresh.get(name, ()):
+                    self._windows.pop(name, None)
+            self._rules = fresh
+            self._complete = True
+        return sorted(self._rules)
+
+    def _week(self, tutor_name: str, week_start: date_type) -> tuple:
+        windows = self._windows.setdefault(tutor_name, {})
+        occurrences = windows.get(week_start)
+        if occurrences is None:
+            occurrences = tuple(
+                Occurrence(week_start + timedelta(days=day_index), hour, tutor_name, client)
+                for day_index, hour, client in self._rules.get(tutor_name, ())
+            )
+            if len(windows) >= self.max_weeks:
+                windows.pop(next(iter(windows))) # najdawniej rozwinięty tydzień
+            windows[week_start] = occurrences
+        return occurrences
+
+    # --- Zapytania ---
+
+    def occurrences(self, start: Union[str, date_type], end: Union[str, date_type],
+                    tutor_name: Optional[str] = None) -> Iterator[Occurrence]:
+        """
+        Generator wystąpień w przedziale dat [start, end), w kolejności (data, godzina, korepetytor).
+        tutor_name ogranicza wynik do jednego korepetytora (ImieNazwisko).
+        """
+        if not isinstance(start, date_type):
+            start = date_type.fromisoformat(start)
+        if not isinstance(end, date_type):
+            end = date_type.fromisoformat(end)
+        week_start = WeeklySlotEngine.week_start(start)
+        with self._lock:
+            if self._watch.changed() and (self._rules or self._windows):
+                self.invalidate()
+                self.full_invalidations += 1
+        while week_start < end:
+            with self._lock:
+                names = self._load_rules(tutor_name)
+                week = [occurrence for name in names for occurrence in self._week(name, week_start)]
+            week.sort(key=lambda occurrence: (occurrence.date, occurrence.hour, occurrence.tutor))
+            for occurrence in week:
+                if start <= occurrence.date < end:
+                    yield occurrence
+            week_start += timedelta(days=7)
+
+    def occurrences_on(self, day: Union[str, date_type], tutor_name: Optional[str] = None) -> List[Occurrence]:
+        """Wystąpienia jednego dnia (np. sprawdzenie konfliktu z nową rezerwacją)."""
+        if not isinstance(day, date_type):
+            day = date_type.fromisoformat(day)
+        return list(self.occurrences(day, day + timedelta(days=1), tutor_name))
+
+    # --- Unieważnianie ---
+
+    def invalidate_tutor(self, tutor_name: str) -> None:
+        with self._lock:
+            self._rules.pop(tutor_name, None)
+            self._windows.pop(tutor_name, None)
+            self._complete = False
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._rules.clear()
+            self._windows.clear()
+            self._complete = False
+
+    def _on_recurring_write(self, action, record_ids, field_names):
+        if action == 'delete' or (action == 'update' and 'Korepetytor' in field_names):
+            # Nie znamy poprzedniego korepetytora rekordu - przeładuj wszystko
+            self.invalidate()
+            return
+        placeholders = ', '.join(['?' for _ in record_ids])
+        with pooled_connection() as conn:
+            rows = conn.execute(f"SELECT DISTINCT Korepetytor FROM StaleRezerwacje WHERE id IN ({placeholders})", record_ids).fetchall()
+        for row in rows:
+            self.invalidate_tutor(row['Korepetytor'])
+
+    def attach(self) -> 'RecurringExpander':
+        """Podpina unieważnianie pod zapisy StaleRezerwacje przez DatabaseTable w tym procesie."""
+        if not self._attached:
+            add_write_listener('StaleRezerwacje', self._on_recurring_write)
+            self._watch.attach()
+            self._attached = True
+        return self
+
+    def detach(self) -> None:
+        if self._attached:
+            remove_write_listener('StaleRezerwacje', self._on_recurring_write)
+            self._watch.detach()
+            self._attached = False
+
+_recurring_expander = None
+
+def get_recurring_expander() -> RecurringExpander:
+    """Współdzielony ekspander stałych rezerwacji, podpięty pod zapisy DatabaseTable."""
+    global _recurring_expander
+    with _slot_engine_lock:
+        if _recurring_expander is None:
+            _recurring_expander = RecurringExpander().attach()
+        return _recurring_expander
+
+# ------------------------------------------------------------
+# Migawka tabeli Korepetytorzy w pamięci
+# ------------------------------------------------------------
+
+class _TutorIndex:
+    """Niezmienny stan migawki - podmieniany w całości przy odświeżeniu."""
+    __slots__ = ('version', 'records', 'by_id', 'by_name', 'by_subject', 'by_level', 'by_subject_level')
+
+    def __init__(self, version: int, records: List[Dict]):
+        self.version = version
+        self.records = tuple(records)
+        self.by_id = {record['fields'].get('TutorID'): record for record in records}
+        self.by_name = {record['fields'].get('ImieNazwisko'): record for record in records}
+        by_subject, by_level, by_subject_level = {}, {}, {}
+        for record in records:
+            subjects = record['fields'].get('Przedmioty') or []
+            levels = record['fields'].get('PoziomNauczania') or []
+            for subject in subjects:
+                by_subject.setdefault(subject, []).append(record)
+                for level in levels:
+                    by_subject_level.setdefault((subject, level), []).append(record)
+            for level in levels:
+                by_level.setdefault(level, []).append(record)
+        self.by_subject = {key: tuple(value) for key, value in by_subject.items()}
+        self.by_level = {key: tuple(value) for key, value in by_level.items()}
+        self.by_subject_level = {key: tuple(value) for key, value in by_subject_level.items()}
+
+class TutorSnapshot:
+    """
+    Zdekodowana kopia tabeli Korepetytorzy w pamięci, z indeksami po TutorID, ImieNazwisko,
+    przedmiocie i poziomie - np. find('Matematyka', 'liceum_rozszerzenie') to jedno trafienie w słownik.
+
+    Świeżość: przy odczycie sprawdzane jest PRAGMA data_version (zmienia się po commicie
+    dowolnego innego połączenia, także z innego procesu); dopiero wtedy odczytywany jest
+    licznik TableVersions['Korepetytorzy'], podbijany triggerami przy każdym zapisie tabeli.
+    Tabela jest przeładowywana tylko, gdy licznik się zmienił.
+
+    Zwracane rekordy są współdzielone przez wszystkich wywołujących - tylko do odczytu.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, check_interval: float = 0.0):
+        self.db_path = db_path or database.DB_PATH
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._watch_conn = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self.reloads = 0
+
+    def _current(self) -> _TutorIndex:
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._checked_at < self.check_interval:
+            return index
+        with self._lock:
+            self._checked_at = now
+            if self._watch_conn is None:
+                self._watch_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._index is not None and data_version == self._data_version:
+                return self._index
+            self._data_version = data_version
+            row = self._watch_conn.execute("SELECT version FROM TableVersions WHERE name = 'Korepetytorzy'").fetchone()
+            version = row[0] if row is not None else None
+            if self._index is None or version is None or version != self._index.version:
+                # Odczyt z tego samego połączenia: dane odpowiadają właśnie odczytanemu licznikowi
+                tutors = DatabaseTable('Korepetytorzy')
+                cursor = self._watch_conn.execute("SELECT * FROM Korepetytorzy ORDER BY id")
+                self._index = _TutorIndex(version, tutors._rows_to_dicts(cursor, cursor.fetchall()))
+                self.reloads += 1
+            return self._index
+
+    def get(self, tutor_id: str) -> Optional[Dict]:
+        """Rekord korepetytora po TutorID."""
+        return self._current().by_id.get(tutor_id)
+
+    def by_name(self, name: str) -> Optional[Dict]:
+        """Rekord korepetytora po ImieNazwisko (tak wskazują go Rezerwacje)."""
+        return self._current().by_name.get(name)
+
+    def find(self, subject: Optional[str] = None, level: Optional[str] = None) -> Tuple[Dict, ...]:
+        """Korepetytorzy uczący przedmiotu i/lub na poziomie (kolejność jak w tabeli)."""
+        index = self._current()
+        if subject and level:
+            return index.by_subject_level.get((subject, level), ())
+        if subject:
+            return index.by_subject.get(subject, ())
+        if level:
+            return index.by_level.get(level, ())
+        return index.records
+
+    def all(self) -> Tuple[Dict, ...]:
+        return self._current().records
+
+    def invalidate(self) -> None:
+        """Wymusza przeładowanie przy następnym odczycie."""
+        with self._lock:
+            self._index = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
+            self._index = None
+
+_tutor_snapshots: Dict[str, TutorSnapshot] = {}
+
+def get_tutor_snapshot() -> TutorSnapshot:
+    """Współdzielona migawka Korepetytorzy dla bieżącego DB_PATH."""
+    with _slot_engine_lock:
+        snapshot = _tutor_snapshots.get(database.DB_PATH)
+        if snapshot is None:
+            snapshot = _tutor_snapshots[database.DB_PATH] = TutorSnapshot(database.DB_PATH)
+        return snapshot
@@ -0,0 +1,142 @@
+"""
+Kopie zapasowe baz SQLite w trakcie pracy (bez zatrzymywania bota i scrapera).
+
+Kopia powstaje przez sqlite3.Connection.backup małymi porcjami stron z przerwami
+między porcjami, więc piszący (webhooki, scraper) nie czekają na blokadę. Gotowa
+kopia jest sprawdzana (PRAGMA quick_check), kompresowana gzipem i rotowana:
+w katalogu zostaje BACKUP_KEEP najnowszych kopii każdej bazy.
+
+Uruchom: python database_backup.py [katalog_kopii]
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import database
+
+BACKUP_DIR = os.environ.get('DB_BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups'))
+BACKUP_KEEP = int(os.environ.get('DB_BACKUP_KEEP', '14'))
+# Porcja kopiowania i przerwa po każdej porcji - czas dla piszących
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+# Zapis do bazy przez inne połączenie w trakcie kopii zaczyna ją od nowa; po tylu
+# restartach kopiujemy resztę w jednym kroku (w WAL to tylko odczyt - piszący nie czekają)
+BACKUP_MAX_RESTARTS = 3
+
+# Bazy statystyk leżą obok modułów database_stats / database_hourly_stats.
+# Ścieżki są podane wprost, bo import tych modułów inicjalizuje bazy.
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_DB_PATHS = [
+    os.path.join(_MODULE_DIR, 'facebook_stats.db'),
+    os.path.join(_MODULE_DIR, 'hourly_stats.db'),
+]
+
+class _SourceKeepsChanging(Exception):
+    """Przerywa kopiowanie porcjami, gdy baza jest zbyt często zmieniana w trakcie."""
+
+def _backup_name(db_path: str, stamp: str) -> str:
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{name}-{stamp}.db"
+
+def _rotate(backup_dir: str, db_path: str, keep: int) -> List[str]:
+    """Usuwa najstarsze kopie bazy ponad `keep`; zwraca usunięte pliki."""
+    prefix = os.path.splitext(os.path.basename(db_path))[0] + '-'
+    backups = sorted(f for f in os.listdir(backup_dir)
+                     if f.startswith(prefix) and (f.endswith('.db') or f.endswith('.db.gz')))
+    removed = backups[:-keep] if keep > 0 else []
+    for filename in removed:
+        os.remove(os.path.join(backup_dir, filename))
+    return removed
+
+def backup_database(db_path: str, backup_dir: str = BACKUP_DIR, compress: bool = True, keep: int = BACKUP_KEEP,
+                    pages: int = BACKUP_PAGES_PER_STEP, step_sleep: float = BACKUP_STEP_SLEEP) -> Dict:
+    """
+    Tworzy kopię jednej bazy; zwraca raport (czas, liczba stron i kroków, restarty, rozmiary).
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    target = os.path.join(backup_dir, _backup_name(db_path, stamp))
+    partial = target + '.part'
+    report = {'database': db_path, 'file': None, 'pages': 0, 'steps': 0, 'restarts': 0}
+    started = time.perf_counter()
+
+    source = sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True, timeout=20)
+    destination = sqlite3.connect(partial)
+    try:
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal last_remaining
+            report['steps'] += 1
+            report['pages'] = total
+            if last_remaining is not None and remaining > last_remaining:
+                report['restarts'] += 1 # Źródło zmieniło się w trakcie - SQLite kopiuje od początku
+            last_remaining = remaining
+            if report['restarts'] >= BACKUP_MAX_RESTARTS:
+                raise _SourceKeepsChanging()
+            time.sleep(step_sleep)
+
+        try:
+            source.backup(destination, pages=pages, progress=progress)
+        except _SourceKeepsChanging:
+            # Dokończ jednym krokiem: to migawka odczytu, zapisy idą w tym czasie do WAL
+            source.backup(destination, pages=-1)
+        check = destination.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"Kopia {db_path} nie przeszła quick_check: {check}")
+    finally:
+        destination.close()
+        source.close()
+
+    copy_seconds = time.perf_counter() - started
+    report['size'] = os.path.getsize(partial)
+    if compress:
+        with open(partial, 'rb') as raw, gzip.open(target + '.gz', 'wb', compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed)
+        os.remove(partial)
+        target += '.gz'
+    else:
+        os.replace(partial, target)
+    report['file'] = target
+    report['stored_size'] = os.path.getsize(target)
+    report['copy_seconds'] = copy_seconds
+    report['seconds'] = time.perf_counter() - started
+    report['rotated'] = _rotate(backup_dir, db_path, keep)
+    return report
+
+def backup_all(backup_dir: str = BACKUP_DIR, compress: bool = True, keep: int = BACKUP_KEEP) -> List[Dict]:
+    """
+    Kopie bazy głównej (database.DB_PATH) i baz statystyk, które istnieją.
+    Błąd jednej kopii nie przerywa pozostałych. Wypisuje raport czasów.
+    """
+    reports = []
+    for db_path in [database.DB_PATH] + STATS_DB_PATHS:
+        if not os.path.exists(db_path):
+            continue
+        try:
+            report = backup_database(db_path, backup_dir, compress=compress, keep=keep)
+        except Exception as e:
+            print(f"BŁĄD KOPII: {db_path}: {e}")
+            reports.append({'database': db_path, 'error': str(e)})
+            continue
+        reports.append(report)
+        print(f"KOPIA: {os.path.basename(db_path)} -> {os.path.basename(report['file'])}: "
+              f"{report['pages']} stron w {report['steps']} krokach, {report['restarts']} restartów, "
+              f"kopia {report['copy_seconds']:.2f} s, razem {report['seconds']:.2f} s, "
+              f"{report['size'] / 2 ** 20:.1f} MiB -> {report['stored_size'] / 2 ** 20:.1f} MiB")
+    return reports
+
+def schedule_backups(scheduler, hour: int = 3, minute: int = 30, backup_dir: Optional[str] = None):
+    """Dodaje codzienną kopię do schedulera APScheduler (jak przypomnienia w bot.py)."""
+    return scheduler.add_job(func=backup_all, trigger="cron", hour=hour, minute=minute,
+                             kwargs={'backup_dir': backup_dir or BACKUP_DIR}, id='database_backup',
+                             replace_existing=True)
+
+if __name__ == '__main__':
+    backup_all(sys.argv[1] if len(sys.argv) > 1 else BACKUP_DIR)
@@ -0,0 +1,283 @@
+"""
+Kompilator formuł w stylu Airtable do sparametryzowanych klauzul WHERE SQLite.
+
+Obsługiwany podzbiór:
+    {Pole}, 'tekst', "tekst", liczby
+    porównania: =, !=, <>, <, >, <=, >=
+    AND(...), OR(...), NOT(x)
+    IS_AFTER(a, b), IS_BEFORE(a, b)
+    DATETIME_FORMAT(x, 'YYYY-MM-DD'), DATETIME_PARSE(x)
+    BLANK(), TRUE(), FALSE()
+
+Kolumny z czasem uniksowym (TIMESTAMP_FIELDS, np. {start_ts} w Rezerwacje) porównane
+z tekstem daty ('YYYY-MM-DD' albo 'YYYY-MM-DD HH:MM', czas Europe/Warsaw) dostają
+parametr liczbowy, więc filtr zakresu dat idzie po indeksie tej kolumny:
+    AND(IS_AFTER({start_ts}, '2025-06-01 12:00'), IS_BEFORE({start_ts}, '2025-06-02'))
+
+Wynik kompilacji jest cache'owany per tekst formuły, więc kolejne zapytania
+z tą samą formułą pomijają tokenizację i parsowanie.
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import pytz
+
+class FormulaError(ValueError):
+    """Formuła zawiera konstrukcję, której nie da się skompilować do SQL."""
+
+_TOKEN_RE = re.compile(r"""
+    (?P<field>\{[^}]+\})
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<op><=|>=|!=|<>|=|<|>)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<punct>[(),])
+""", re.VERBOSE)
+
+_COMPARISON_OPS = {'=': '=', '!=': '!=', '<>': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+
+# Tokeny formatu dat Airtable -> strftime SQLite (dłuższe najpierw)
+_DATE_FORMAT_TOKENS = [('YYYY', '%Y'), ('MM', '%m'), ('DD', '%d'), ('HH', '%H'), ('mm', '%M'), ('ss', '%S')]
+# Formaty, w których daty są już zapisane w bazie - kolumna zostaje "goła", więc indeks działa
+_NATIVE_DATE_FORMATS = ('YYYY-MM-DD',)
+
+# Strefa czasowa dat i godzin zapisanych w bazie
+LOCAL_TIMEZONE = pytz.timezone('Europe/Warsaw')
+# Kolumny z czasem uniksowym (sekundy), wyliczane z daty i godziny (database.DERIVED_COLUMNS)
+TIMESTAMP_FIELDS = frozenset(['start_ts'])
+
+def local_timestamp(date_text, time_text=None) -> Optional[int]:
+    """
+    Czas uniksowy dla daty 'YYYY-MM-DD' i godziny 'H:MM' w strefie LOCAL_TIMEZONE.
+    Bez time_text godzina może być częścią date_text ('YYYY-MM-DD HH:MM'), a jej brak oznacza północ.
+    Zwraca None dla wartości, których nie da się odczytać.
+    """
+    if not date_text:
+        return None
+    date_part, _, time_part = str(date_text).strip().replace('T', ' ').partition(' ')
+    if time_text:
+        time_part = str(time_text)
+    try:
+        value = datetime.strptime(date_part, '%Y-%m-%d')
+        if time_part.strip():
+            hour, minute = time_part.strip().split(':')[:2]
+            value = value.replace(hour=int(hour), minute=int(minute))
+    except ValueError:
+        return None
+    # Godziny niejednoznaczne/nieistniejące przy zmianie czasu liczymy jak w czasie zimowym
+    return int(LOCAL_TIMEZONE.localize(value, is_dst=False).timestamp())
+
+class _Blank:
+    """Znacznik BLANK() - porównanie z nim kompiluje się do IS NULL / ''."""
+
+_BLANK = _Blank()
+
+_TIMESTAMP_COLUMNS = frozenset('"' + name + '"' for name in TIMESTAMP_FIELDS)
+
+def _tokenize(formula: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    length = len(formula)
+    while pos < length:
+        if formula[pos].isspace():
+            pos += 1
+            continue
+        match = _TOKEN_RE.match(formula, pos)
+        if not match:
+            raise FormulaError(f"Nieoczekiwany znak na pozycji {pos} w formule: {formula!r}")
+        tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _unquote_string(literal: str) -> str:
+    return re.sub(r"\\(.)", r"\1", literal[1:-1])
+
+class _Parser:
+    """Parser zstępujący, który od razu emituje fragmenty SQL i parametry."""
+
+    def __init__(self, formula: str):
+        self.formula = formula
+        self.tokens = _tokenize(formula)
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise FormulaError(f"Niespodziewany koniec formuły: {self.formula!r}")
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str):
+        kind, text = self._next()
+        if text != value:
+            raise FormulaError(f"Oczekiwano '{value}', otrzymano '{text}' w formule: {self.formula!r}")
+
+    def parse(self):
+        sql, params = self._expression()
+        if self._peek()[0] is not None:
+            raise FormulaError(f"Nadmiarowe elementy po pozycji {self.pos} w formule: {self.formula!r}")
+        if sql is _BLANK:
+            raise FormulaError(f"BLANK() nie może być samodzielnym warunkiem: {self.formula!r}")
+        return sql, params
+
+    def _expression(self):
+        left_sql, left_params = self._operand()
+        kind, text = self._peek()
+        if kind != 'op':
+            return left_sql, left_params
+        self._next()
+        right_sql, right_params = self._operand()
+        return self._comparison(_COMPARISON_OPS[text], left_sql, left_params, right_sql, right_params)
+
+    def _comparison(self, op, left_sql, left_params, right_sql, right_params):
+        if right_sql is _BLANK and left_sql is _BLANK:
+            raise FormulaError(f"Porównanie BLANK() z BLANK(): {self.formula!r}")
+        if left_sql is _BLANK:
+            left_sql, right_sql = right_sql, left_sql
+            left_params, right_params = right_params, left_params
+        if right_sql is _BLANK:
+            if op == '=':
+                return f"({left_sql} IS NULL OR {left_sql} = '')", left_params * 2
+            if op == '!=':
+                return f"({left_sql} IS NOT NULL AND {left_sql} != '')", left_params * 2
+            raise FormulaError(f"BLANK() można porównywać tylko przez = lub !=: {self.formula!r}")
+        left_params, right_params = self._timestamp_operands(left_sql, left_params, right_sql, right_params)
+        return f"{left_sql} {op} {right_sql}", left_params + right_params
+
+    def _timestamp_operands(self, left_sql, left_params, right_sql, right_params):
+        """Tekst daty porównywany z kolumną czasu uniksowego zamienia się na liczbę sekund."""
+        if left_sql in _TIMESTAMP_COLUMNS and right_sql == '?':
+            return left_params, [self._timestamp_param(right_params[0])]
+        if right_sql in _TIMESTAMP_COLUMNS and left_sql == '?':
+            return [self._timestamp_param(left_params[0])], right_params
+        return left_params, right_params
+
+    def _timestamp_param(self, value):
+        if not isinstance(value, str):
+            return value
+        timestamp = local_timestamp(value)
+        if timestamp is None:
+            raise FormulaError(f"Nieprawidłowa data {value!r} (oczekiwano 'YYYY-MM-DD[ HH:MM]'): {self.formula!r}")
+        return timestamp
+
+    def _operand(self):
+        kind, text = self._next()
+        if kind == 'field':
+            return _quote_identifier(text[1:-1].strip()), []
+        if kind == 'string':
+            return '?', [_unquote_string(text)]
+        if kind == 'number':
+            if '.' in text:
+                return '?', [float(text)]
+            # Liczby całkowite trafiają do SQL wprost (są zwalidowane regexem), dzięki czemu
+            # planer może użyć indeksów częściowych, np. "... WHERE Aktywna = 1"
+            return str(int(text)), []
+        if kind == 'name':
+            return self._call(text.upper())
+        if text == '(':
+            sql, params = self._expression()
+            self._expect(')')
+            return f"({sql})", params
+        raise FormulaError(f"Nieoczekiwany element '{text}' w formule: {self.formula!r}")
+
+    def _arguments(self):
+        self._expect('(')
+        args = []
+        if self._peek()[1] == ')':
+            self._next()
+            return args
+        while True:
+            args.append(self._expression())
+            kind, text = self._next()
+            if text == ')':
+                return args
+            if text != ',':
+                raise FormulaError(f"Oczekiwano ',' lub ')', otrzymano '{text}' w formule: {self.formula!r}")
+
+    def _call(self, name):
+        start = self.pos
+        args = self._arguments()
+        raw_args = self.tokens[start:self.pos]
+
+        if name in ('AND', 'OR'):
+            if not args:
+                raise FormulaError(f"{name}() wymaga co najmniej jednego argumentu: {self.formula!r}")
+            self._reject_blank(name, args)
+            joined = f" {name} ".join(sql for sql, _ in args)
+            return f"({joined})", [p for _, params in args for p in params]
+
+        if name == 'NOT':
+            self._check_arity(name, args, 1)
+            self._reject_blank(name, args)
+            sql, params = args[0]
+            return f"NOT ({sql})", params
+
+        if name in ('IS_AFTER', 'IS_BEFORE'):
+            self._check_arity(name, args, 2)
+            self._reject_blank(name, args)
+            op = '>' if name == 'IS_AFTER' else '<'
+            (left_sql, left_params), (right_sql, right_params) = args
+            left_params, right_params = self._timestamp_operands(left_sql, left_params, right_sql, right_params)
+            return f"{left_sql} {op} {right_sql}", left_params + right_params
+
+        if name in ('DATETIME_FORMAT', 'DATETIME_PARSE'):
+            if not 1 <= len(args) <= 2:
+                raise FormulaError(f"{name}() przyjmuje 1 lub 2 argumenty: {self.formula!r}")
+            self._reject_blank(name, args)
+            value_sql, value_params = args[0]
+            if len(args) == 1:
+                return value_sql, value_params
+            date_format = self._literal_format(name, raw_args)
+            if date_format in _NATIVE_DATE_FORMATS:
+                return value_sql, value_params
+            if name == 'DATETIME_PARSE':
+                raise FormulaError(f"DATETIME_PARSE obsługuje tylko format {_NATIVE_DATE_FORMATS}: {self.formula!r}")
+            return f"strftime(?, {value_sql})", [_to_strftime(date_format)] + value_params
+
+        if name in ('BLANK', 'TRUE', 'FALSE'):
+            self._check_arity(name, args, 0)
+            if name == 'BLANK':
+                return _BLANK, []
+            return ('1' if name == 'TRUE' else '0'), []
+
+        raise FormulaError(f"Nieobsługiwana funkcja {name}() w formule: {self.formula!r}")
+
+    def _check_arity(self, name, args, count):
+        if len(args) != count:
+            raise FormulaError(f"{name}() przyjmuje {count} argument(y), podano {len(args)}: {self.formula!r}")
+
+    def _reject_blank(self, name, args):
+        if any(sql is _BLANK for sql, _ in args):
+            raise FormulaError(f"BLANK() nie jest dozwolone jako argument {name}(): {self.formula!r}")
+
+    def _literal_format(self, name, raw_args):
+        # Format daty musi być literałem - inaczej nie da się go przetłumaczyć na strftime
+        kind, text = raw_args[-2]
+        if kind != 'string' or raw_args[-3][1] != ',':
+            raise FormulaError(f"Format w {name}() musi być stałym tekstem: {self.formula!r}")
+        return _unquote_string(text)
+
+def _to_strftime(date_format: str) -> str:
+    result = date_format.replace('%', '%%')
+    for airtable_token, strftime_token in _DATE_FORMAT_TOKENS:
+        result = result.replace(airtable_token, strftime_token)
+    return result
+
+@lru_cache(maxsize=1024)
+def compile_formula(formula: str) -> Tuple[str, Tuple]:
+    """
+    Kompiluje formułę do (klauzula_where, parametry).
+    Pusta formuła oznacza brak filtra. Rzuca FormulaError dla nieobsługiwanych konstrukcji.
+    """
+    if not formula or not formula.strip():
+        return ("1=1", ())
+    sql, params = _Parser(formula).parse()
+    return (sql, tuple(params))
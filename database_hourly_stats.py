@@ -3,37 +3,22 @@ import os
 from datetime import datetime
 import pytz
 
+from database_migrations import apply_migrations, add_column
+from database_pragmas import apply_profile
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'hourly_stats.db')
 
 def get_connection():
     """Zwraca połączenie z bazą danych statystyk godzinowych."""
     conn = sqlite3.connect(DB_PATH)
+    apply_profile(conn)
     conn.row_factory = sqlite3.Row
     return conn
 
-def _migrate_database():
-    """Wykonuje niezbędne migracje (dodaje brakujące kolumny)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Sprawdź, czy kolumna sent_comments_count istnieje
-    cursor.execute("PRAGMA table_info(HourlyStats)")
-    columns = [info[1] for info in cursor.fetchall()]
-    if 'sent_comments_count' not in columns:
-        try:
-            cursor.execute("ALTER TABLE HourlyStats ADD COLUMN sent_comments_count INTEGER DEFAULT 0")
-            print("✓ Migracja: dodano kolumnę 'sent_comments_count' do HourlyStats")
-        except Exception as e:
-            print(f"Błąd migracji: {e}")
-
-    conn.commit()
-    conn.close()
-
-def init_hourly_stats_database():
-    """Tworzy tabelę, jeśli nie istnieje (przy pierwszym uruchomieniu)."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
+# Migracje schematu bazy statystyk godzinowych (PRAGMA user_version, patrz database_migrations.py)
+SCHEMA_MIGRATIONS = [
+    (1, [
+        '''
         CREATE TABLE IF NOT EXISTS HourlyStats (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp TEXT UNIQUE NOT NULL,
@@ -42,17 +27,19 @@ def init_hourly_stats_database():
             sent_comments_count INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    conn.commit()
-    conn.close()
-    print(f"✓ Baza danych statystyk godzinowych zainicjalizowana: {DB_PATH}")
+        ''',
+        # Kolumna sent_comments_count doszła później - bazy sprzed wersjonowania mogą jej nie mieć
+        add_column('HourlyStats', 'sent_comments_count', 'INTEGER DEFAULT 0'),
+    ]),
+]
 
 def ensure_database():
-    """Zapewnia, że baza istnieje i jest zmigrowana."""
-    if not os.path.exists(DB_PATH):
-        init_hourly_stats_database()
-    else:
-        _migrate_database()   # zawsze uruchamiamy migracje
+    """Zapewnia, że baza istnieje i jest zmigrowana (przy aktualnej wersji - jedno zapytanie PRAGMA)."""
+    conn = get_connection()
+    try:
+        apply_migrations(conn, SCHEMA_MIGRATIONS, label="bazy statystyk godzinowych")
+    finally:
+        conn.close()
 
 # --- Wykonaj przy imporcie modułu ---
 ensure_database()
@@ -0,0 +1,57 @@
+"""
+Wspólny mechanizm migracji schematu dla baz SQLite projektu
+(database.py, database_stats.py, database_hourly_stats.py).
+
+Wersja schematu jest trzymana w PRAGMA user_version. Migracja to para
+(numer, [kroki]); krok to polecenie SQL albo funkcja przyjmująca połączenie.
+Gdy baza ma już najnowszą wersję, start kosztuje jedno zapytanie PRAGMA.
+"""
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+MigrationStep = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, List[MigrationStep]]
+
+def add_column(table: str, column: str, definition: str) -> Callable[[sqlite3.Connection], None]:
+    """
+    Krok migracji dodający kolumnę, jeśli jej brakuje.
+    Potrzebny dla baz sprzed wersjonowania, w których część kolumn dodały dawne migracje.
+    """
+    def step(conn):
+        columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            print(f"Migracja: Dodawanie kolumny {column} do tabeli {table}...")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(conn, migrations: List[Migration], label: str = "bazy") -> int:
+    """
+    Wykonuje migracje nowsze niż PRAGMA user_version - wszystkie w jednej transakcji,
+    razem z ustawieniem nowej wersji. Zwraca wersję schematu po migracji.
+    """
+    latest = max(version for version, _ in migrations)
+    if schema_version(conn) >= latest:
+        return latest
+    # IMMEDIATE + ponowny odczyt wersji: dwa procesy startujące naraz nie wykonają migracji dwa razy
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current_version = schema_version(conn)
+        for version, steps in sorted(migrations, key=lambda migration: migration[0]):
+            if version <= current_version:
+                continue
+            print(f"Migracja: schemat {label} do wersji {version}...")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            current_version = version
+        conn.execute(f"PRAGMA user_version = {int(current_version)}")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    return current_version
@@ -0,0 +1,53 @@
+"""
+Profile wydajności SQLite wspólne dla database.py, database_stats.py i database_hourly_stats.py.
+
+Profil to zestaw PRAGMA ustawianych przy otwieraniu połączenia:
+    durable  - WAL + synchronous=FULL: każdy commit przetrwa także awarię zasilania (dotychczasowe zachowanie)
+    balanced - WAL + synchronous=NORMAL: baza nie ulegnie uszkodzeniu, ale po awarii systemu
+               mogą zniknąć ostatnie commity; większy cache i mmap
+    fast     - synchronous=OFF: tylko dla danych, które można odtworzyć (np. benchmarki, importy)
+
+Profil wybiera zmienna środowiskowa DB_PROFILE (domyślnie "durable").
+Porównanie profili: python tests/benchmark_database.py profiles
+"""
+import os
+from typing import Optional
+
+# Kolejność ma znaczenie: journal_mode musi być ustawiony przed pozostałymi
+PROFILES = {
+    'durable': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'FULL'),
+        ('busy_timeout', 20000),
+        ('cache_size', -2000),        # KiB (domyślne ~2 MB)
+        ('temp_store', 'DEFAULT'),
+        ('mmap_size', 0),
+    ],
+    'balanced': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', 20000),
+        ('cache_size', -16000),       # ~16 MB
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 64 * 1024 * 1024),
+    ],
+    'fast': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'OFF'),
+        ('busy_timeout', 20000),
+        ('cache_size', -64000),       # ~64 MB
+        ('temp_store', 'MEMORY'),
+        ('mmap_size', 256 * 1024 * 1024),
+    ],
+}
+
+DEFAULT_PROFILE = os.environ.get('DB_PROFILE', 'durable')
+
+def apply_profile(conn, profile: Optional[str] = None):
+    """Ustawia PRAGMA profilu (domyślnie DEFAULT_PROFILE) na połączeniu i je zwraca."""
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Nieznany profil bazy {name!r} (dostępne: {', '.join(PROFILES)})")
+    for pragma, value in PROFILES[name]:
+        conn.execute(f"PRAGMA {pragma}={value}")
+    return conn
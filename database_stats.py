@@ -7,22 +7,24 @@ import os
 from datetime import datetime
 import pytz
 
+from database_migrations import apply_migrations, add_column
+from database_pragmas import apply_profile
+
 # Osobna baza danych dla statystyk Facebook
 DB_PATH = os.path.join(os.path.dirname(__file__), 'facebook_stats.db')
 
 def get_connection():
     """Zwraca połączenie z bazą danych statystyk."""
     conn = sqlite3.connect(DB_PATH)
+    apply_profile(conn)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_stats_database():
-    """Inicjalizuje bazę danych statystyk."""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Tabela Statystyki (odpowiednik Airtable)
-    cursor.execute('''
+# Migracje schematu bazy statystyk (PRAGMA user_version, patrz database_migrations.py)
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # Tabela Statystyki (odpowiednik Airtable)
+        '''
         CREATE TABLE IF NOT EXISTS Statystyki (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             Data TEXT UNIQUE NOT NULL,
@@ -33,18 +35,12 @@ def init_stats_database():
             LastCommentTime TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    
-    # Dodaj kolumnę Scrolls jeśli nie istnieje (dla migracji)
-    try:
-        cursor.execute("ALTER TABLE Statystyki ADD COLUMN Scrolls INTEGER DEFAULT 0")
-    except sqlite3.OperationalError:
-        pass # Kolumna już istnieje
-    
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_statystyki_data ON Statystyki(Data)')
-    
-    # Tabela Logów Komentarzy (szczegółowe zdarzenia)
-    cursor.execute('''
+        ''',
+        # Kolumna Scrolls doszła później - bazy sprzed wersjonowania mogą jej nie mieć
+        add_column('Statystyki', 'Scrolls', 'INTEGER DEFAULT 0'),
+        'CREATE INDEX IF NOT EXISTS idx_statystyki_data ON Statystyki(Data)',
+        # Tabela Logów Komentarzy (szczegółowe zdarzenia)
+        '''
         CREATE TABLE IF NOT EXISTS CommentLogs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -53,10 +49,17 @@ def init_stats_database():
             scrolls_since_refresh INTEGER,
             status TEXT
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
+        ''',
+    ]),
+]
+
+def init_stats_database():
+    """Inicjalizuje bazę danych statystyk (tabele i zaległe migracje)."""
+    conn = get_connection()
+    try:
+        apply_migrations(conn, SCHEMA_MIGRATIONS, label="bazy statystyk")
+    finally:
+        conn.close()
     print(f"✓ Baza danych statystyk zainicjalizowana: {DB_PATH}")
 
 def log_comment(author, post_snippet, scrolls, status):
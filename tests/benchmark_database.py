@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+"""
+Benchmarki warstwy bazy danych (database.py).
+Każdy benchmark działa na świeżej, tymczasowej bazie - nie dotyka DB_PATH z config.py.
+Uruchom: python tests/benchmark_database.py [nazwa_benchmarku ...]
+"""
+
+import gc
+import os
+import sys
+import time
+import shutil
+import datetime
+import tempfile
+import threading
+
+# Dodaj katalog główny repozytorium do sys.path, aby zaimportować database.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import DatabaseTable
+
+_temp_dirs = []
+
+def _fresh_database():
+    """Tworzy pustą bazę w katalogu tymczasowym i przełącza na nią database.DB_PATH."""
+    database.close_pools()
+    database.close_writers()
+    tmp_dir = tempfile.mkdtemp(prefix='strona_bench_')
+    _temp_dirs.append(tmp_dir)
+    database.DB_PATH = os.path.join(tmp_dir, 'bench.db')
+    database.init_database()
+    return database.DB_PATH
+
+def _report(label, count, seconds):
+    rate = count / seconds if seconds else float('inf')
+    print(f"   {label:<45} {count:>8} op. w {seconds:8.3f} s  ->  {rate:12.0f} op/s")
+    return rate
+
+def _seed_clients(n):
+    conn = database.get_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO Klienci (ClientID, Imie, Nazwisko, wolna_kwota) VALUES (?, ?, ?, ?)",
+            [(f"psid{i}", f"Imie{i}", f"Nazwisko{i}", i % 100) for i in range(n)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+# ------------------------------------------------------------
+# Pula połączeń vs połączenie na każde wywołanie
+# ------------------------------------------------------------
+
+def bench_pool(n=5000, threads=8):
+    print("\n== Pula połączeń (DatabaseTable.get) ==")
+    _fresh_database()
+    _seed_clients(1000)
+    clients = DatabaseTable('Klienci')
+
+    def per_call_get(record_id):
+        # Dawne zachowanie: nowe połączenie + PRAGMA przy każdym zapytaniu
+        conn = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM Klienci WHERE id = ?", [record_id])
+            return clients._row_to_dict(cursor.fetchone())
+        finally:
+            conn.close()
+
+    def run(get_fn, label, workers):
+        per_worker = n // workers
+
+        def worker(offset):
+            for i in range(per_worker):
+                get_fn(str((offset + i) % 1000 + 1))
+
+        pool = [threading.Thread(target=worker, args=(w * per_worker,)) for w in range(workers)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return _report(label, per_worker * workers, time.perf_counter() - start)
+
+    for workers in (1, threads):
+        old = run(per_call_get, f"połączenie na wywołanie ({workers} wątk.)", workers)
+        new = run(clients.get, f"pula połączeń ({workers} wątk.)", workers)
+        print(f"   przyspieszenie: x{new / old:.1f}")
+
+# ------------------------------------------------------------
+# Operacje wsadowe vs pętla po pojedynczych rekordach
+# ------------------------------------------------------------
+
+def _reservation_fields(i):
+    return {
+        'Klient': f"psid{i % 1000}",
+        'Korepetytor': f"Korepetytor {i % 50}",
+        'Data': f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}",
+        'Godzina': f"{8 + i % 12}:00",
+        'Przedmiot': 'Matematyka',
+        'Oplacona': False,
+    }
+
+def bench_batch(n=10000):
+    print(f"\n== Operacje wsadowe na {n} rezerwacjach ==")
+    _fresh_database()
+    reservations = DatabaseTable('Rezerwacje')
+    payloads = [_reservation_fields(i) for i in range(n)]
+
+    start = time.perf_counter()
+    looped = [reservations.create(fields) for fields in payloads]
+    old = _report("create() w pętli", n, time.perf_counter() - start)
+    start = time.perf_counter()
+    batched = reservations.batch_create(payloads)
+    new = _report("batch_create()", n, time.perf_counter() - start)
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+    start = time.perf_counter()
+    for record in looped:
+        reservations.update(record['id'], {'Oplacona': True, 'Status': 'Opłacona'})
+    old = _report("update() w pętli", n, time.perf_counter() - start)
+    start = time.perf_counter()
+    reservations.batch_update([{'id': r['id'], 'fields': {'Oplacona': True, 'Status': 'Opłacona'}} for r in batched])
+    new = _report("batch_update()", n, time.perf_counter() - start)
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+    start = time.perf_counter()
+    for record in looped:
+        reservations.delete(record['id'])
+    old = _report("delete() w pętli", n, time.perf_counter() - start)
+    start = time.perf_counter()
+    reservations.batch_delete([r['id'] for r in batched])
+    new = _report("batch_delete()", n, time.perf_counter() - start)
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+# ------------------------------------------------------------
+# Kodeki wierszy: all() na 50k wierszy
+# ------------------------------------------------------------
+
+def _legacy_row_to_dict(table_name, row):
+    """Dawne DatabaseTable._row_to_dict - sprawdza table_name i buduje listy kolumn dla każdego wiersza."""
+    import json
+    fields = dict(row)
+    record_id = fields.pop('id')
+    for name in database.HIDDEN_COLUMNS:
+        fields.pop(name, None)
+    if table_name == 'Korepetytorzy':
+        days_and_lists = ['Przedmioty', 'PoziomNauczania', 'Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela']
+        for list_col in days_and_lists:
+            val = fields.get(list_col)
+            if isinstance(val, str):
+                try:
+                    fields[list_col] = json.loads(val)
+                except json.JSONDecodeError:
+                    fields[list_col] = [val] if val else []
+            elif val is None:
+                fields[list_col] = []
+    bool_fields = []
+    if table_name == 'Rezerwacje':
+        bool_fields = ['JestTestowa', 'Oplacona', 'confirmed']
+    elif table_name == 'StaleRezerwacje':
+        bool_fields = ['Aktywna']
+    for bf in bool_fields:
+        fields[bf] = database._safe_bool_convert(fields.get(bf, 0))
+    if table_name == 'Klienci':
+        fields['wolna_kwota'] = database._safe_int_convert(fields.get('wolna_kwota'), 0)
+    elif table_name == 'Korepetytorzy':
+        if fields.get('LimitGodzinTygodniowo') is not None:
+            fields['LimitGodzinTygodniowo'] = database._safe_int_convert(fields.get('LimitGodzinTygodniowo'), None)
+    return {'id': str(record_id), 'fields': fields}
+
+def _tutor_fields(i):
+    return {
+        'TutorID': f"tutor{i}",
+        'ImieNazwisko': f"Korepetytor {i}",
+        'Poniedziałek': ['14:00-20:00'], 'Wtorek': ['16:00-18:00', '19:00'], 'Środa': [],
+        'Czwartek': ['8:00-12:00'], 'Piątek': ['14:00-20:00'], 'Sobota': [], 'Niedziela': [],
+        'Przedmioty': ['Matematyka', 'Fizyka'],
+        'PoziomNauczania': ['podstawowka', 'liceum_podstawa', 'liceum_rozszerzenie'],
+        'LimitGodzinTygodniowo': 10 + i % 10,
+        'Email': f"tutor{i}@example.com",
+    }
+
+def bench_codec(n=50000):
+    print(f"\n== all() na {n} wierszach: dawny _row_to_dict vs RowCodec ==")
+    _fresh_database()
+    cases = [
+        ('Korepetytorzy', _tutor_fields),
+        ('Rezerwacje', _reservation_fields),
+    ]
+    for table_name, make_fields in cases:
+        table = DatabaseTable(table_name)
+        table.batch_create([make_fields(i) for i in range(n)])
+
+        def legacy_all():
+            with database.pooled_connection() as conn:
+                rows = conn.execute(f"SELECT * FROM {table_name}").fetchall()
+                return [_legacy_row_to_dict(table_name, row) for row in rows]
+
+        assert table.all() == legacy_all(), "RowCodec zwraca inne dane niż dawny _row_to_dict"
+        gc.collect()
+        # Wynik każdego pomiaru jest zwalniany przed kolejnym, żeby GC nie przeglądał cudzych obiektów
+        start = time.perf_counter()
+        legacy_all()
+        old = _report(f"{table_name}: przed (wiersze/s)", n, time.perf_counter() - start)
+        gc.collect()
+        start = time.perf_counter()
+        table.all()
+        new = _report(f"{table_name}: po (wiersze/s)", n, time.perf_counter() - start)
+        print(f"   przyspieszenie: x{new / old:.1f}")
+        if table_name == 'Korepetytorzy':
+            lazy_table = DatabaseTable(table_name, lazy_lists=True)
+            gc.collect()
+            start = time.perf_counter()
+            emails = [r['fields']['Email'] for r in lazy_table.all()]
+            lazy = _report(f"{table_name}: leniwe listy (wiersze/s)", len(emails), time.perf_counter() - start)
+            print(f"   przyspieszenie: x{lazy / old:.1f}")
+
+# ------------------------------------------------------------
+# Silnik wolnych terminów: 200 korepetytorów x 4 tygodnie
+# ------------------------------------------------------------
+
+def _naive_free_slots(week_start, tutors, lesson_minutes=60, slot_minutes=30):
+    """Podejście "rekord po rekordzie": osobne zapytania DatabaseTable per korepetytor i pętle po godzinach."""
+    from datetime import timedelta
+    reservations = DatabaseTable('Rezerwacje')
+    recurring = DatabaseTable('StaleRezerwacje')
+    week_end = week_start + timedelta(days=7)
+    result = {}
+    for tutor in tutors:
+        f = tutor['fields']
+        name = f['ImieNazwisko']
+        one_off = reservations.all(
+            f"AND({{Korepetytor}} = '{name}', NOT(IS_BEFORE({{Data}}, '{week_start.isoformat()}')), "
+            f"IS_BEFORE({{Data}}, '{week_end.isoformat()}'))"
+        )
+        fixed = recurring.all(f"AND({{Korepetytor}} = '{name}', {{Aktywna}} = 1)")
+        one_off = [r for r in one_off if r['fields']['Status'] not in ('Anulowana', 'Odwołana')]
+        busy = set()
+        for r in one_off:
+            day = (datetime.date.fromisoformat(r['fields']['Data']) - week_start).days
+            h, m = map(int, r['fields']['Godzina'].split(':'))
+            busy.update((day, h * 60 + m + k) for k in range(0, lesson_minutes, slot_minutes))
+        for r in fixed:
+            day = database.WEEKDAY_COLUMNS.index(r['fields']['DzienTygodnia'])
+            h, m = map(int, r['fields']['Godzina'].split(':'))
+            busy.update((day, h * 60 + m + k) for k in range(0, lesson_minutes, slot_minutes))
+        limit = f['LimitGodzinTygodniowo']
+        if limit is not None and (len(one_off) + len(fixed)) * lesson_minutes >= limit * 60:
+            continue
+        available = set()
+        for day, column in enumerate(database.WEEKDAY_COLUMNS):
+            for entry in f[column]:
+                start, _, end = entry.partition('-')
+                h, m = map(int, start.split(':'))
+                begin = h * 60 + m
+                if end:
+                    h, m = map(int, end.split(':'))
+                    finish = h * 60 + m
+                else:
+                    finish = begin + lesson_minutes
+                available.update((day, t) for t in range(begin, finish, slot_minutes))
+        slots = []
+        for day, t in sorted(available):
+            lesson = [(day, t + k) for k in range(0, lesson_minutes, slot_minutes)]
+            if t + lesson_minutes <= 24 * 60 and all(p in available and p not in busy for p in lesson):
+                slots.append((week_start + timedelta(days=day), t))
+        if slots:
+            result[f['TutorID']] = slots
+    return result
+
+def bench_slots(tutors=200, weeks=4):
+    import random
+    from datetime import timedelta
+    import database_availability
+    print(f"\n== Wolne terminy: {tutors} korepetytorów x {weeks} tygodnie ==")
+    _fresh_database()
+    rng = random.Random(7)
+    days = database.WEEKDAY_COLUMNS
+    tutor_rows = []
+    for i in range(tutors):
+        fields = {'TutorID': f"tutor{i}", 'ImieNazwisko': f"Korepetytor {i}",
+                  'LimitGodzinTygodniowo': rng.choice([None, 10, 20])}
+        for day in days[:5]:
+            start = rng.randint(8, 14)
+            fields[day] = [f"{start}:00-{start + rng.randint(3, 6)}:00"]
+        fields['Sobota'] = [f"{h}:00" for h in (9, 10, 11)]
+        tutor_rows.append(fields)
+    DatabaseTable('Korepetytorzy').batch_create(tutor_rows)
+    first_monday = datetime.date(2026, 1, 5)
+    reservations = []
+    for week in range(weeks):
+        for i in range(tutors):
+            for _ in range(rng.randint(0, 6)):
+                reservations.append({
+                    'Klient': f"psid{rng.randint(0, 999)}", 'Korepetytor': f"Korepetytor {i}",
+                    'Data': (first_monday + timedelta(days=7 * week + rng.randint(0, 5))).isoformat(),
+                    'Godzina': f"{rng.randint(8, 19)}:00",
+                    'Status': rng.choice(['Opłacona', 'Oczekuje na płatność', 'Anulowana']),
+                })
+    DatabaseTable('Rezerwacje').batch_create(reservations)
+    DatabaseTable('StaleRezerwacje').batch_create([
+        {'Klient_ID': f"psid{i}", 'Korepetytor': f"Korepetytor {i}", 'DzienTygodnia': rng.choice(days[:5]),
+         'Godzina': f"{rng.randint(8, 19)}:00", 'Aktywna': True}
+        for i in range(0, tutors, 2)
+    ])
+    week_starts = [first_monday + timedelta(days=7 * w) for w in range(weeks)]
+
+    start = time.perf_counter()
+    tutor_records = DatabaseTable('Korepetytorzy').all()
+    naive = [_naive_free_slots(w, tutor_records) for w in week_starts]
+    old = _report("zapytania per korepetytor + pętle", tutors * weeks, time.perf_counter() - start)
+
+    engine = database_availability.WeeklySlotEngine().attach()
+    start = time.perf_counter()
+    masks = engine.free_masks_for_weeks(week_starts)
+    cold = _report("silnik bitowy (zimny)", tutors * weeks, time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(10):
+        engine.free_masks_for_weeks(week_starts)
+    warm = _report("silnik bitowy (ciepły)", tutors * weeks * 10, time.perf_counter() - start)
+
+    # Zgodność wyników z podejściem naiwnym
+    for week_start, week_masks, expected in zip(week_starts, masks, naive):
+        got = {tid: [(d, int(h[:2]) * 60 + int(h[3:])) for d, h in engine.mask_to_slots(week_start, m)]
+               for tid, m in week_masks.items() if m}
+        assert got == expected, "Silnik bitowy zwraca inne terminy niż podejście naiwne"
+
+    # Unieważnianie przez prawdziwe zapisy DatabaseTable: rezerwacja i jej anulowanie
+    reservations_table = DatabaseTable('Rezerwacje')
+    week_loads = engine.week_loads
+    start = time.perf_counter()
+    for i in range(50):
+        record = reservations_table.create({
+            'Klient': 'psid_bench', 'Korepetytor': f"Korepetytor {i}",
+            'Data': (week_starts[i % weeks] + timedelta(days=5)).isoformat(), 'Godzina': '16:00'})
+        engine.free_masks_for_weeks(week_starts)
+        reservations_table.update(record['id'], {'Status': 'Anulowana'})
+        engine.free_masks_for_weeks(week_starts)
+    _report("create()/update() + zapytanie (1 korepetytor)", tutors * weeks * 100, time.perf_counter() - start)
+    assert engine.week_loads == week_loads, "Zapis z tego procesu przeładował cały tydzień zamiast korepetytora"
+    assert engine.free_masks_for_weeks(week_starts) == masks, "Po anulowaniu rezerwacji siatka się nie zgadza"
+    print(f"   przyspieszenie: zimny x{cold / old:.1f}, ciepły x{warm / old:.1f}")
+    engine.detach()
+
+# ------------------------------------------------------------
+# Współbieżne zapisy: bezpośrednio z puli vs jeden wątek zapisujący
+# ------------------------------------------------------------
+
+def bench_writers(writers=32, per_writer=100):
+    print(f"\n== {writers} wątków zapisujących po {per_writer} create() ==")
+
+    def run(label, table):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(writers)
+
+        def worker(w):
+            local = []
+            barrier.wait()
+            for i in range(per_writer):
+                start = time.perf_counter()
+                try:
+                    table.create(_reservation_fields(w * per_writer + i), return_record=False)
+                except Exception as e:
+                    errors.append(e)
+                local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        pool = [threading.Thread(target=worker, args=(w,)) for w in range(writers)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        rate = _report(label, writers * per_writer, time.perf_counter() - start)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"   {'':<45} opóźnienie p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {latencies[-1] * 1000:.1f} ms, błędy: {len(errors)}")
+        return rate
+
+    _fresh_database()
+    old = run("zapisy bezpośrednio z puli", DatabaseTable('Rezerwacje', serialized_writes=False))
+    _fresh_database()
+    new = run("kolejka DatabaseWriter", DatabaseTable('Rezerwacje', serialized_writes=True))
+    database.close_writers()
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+# ------------------------------------------------------------
+# Write-behind: seria pojedynczych update() (np. oznaczanie opłaconych rezerwacji)
+# ------------------------------------------------------------
+
+def bench_write_behind(n=5000):
+    print(f"\n== Oznaczanie {n} rezerwacji jako opłacone pojedynczymi update() ==")
+    _fresh_database()
+    ids = [r['id'] for r in DatabaseTable('Rezerwacje').batch_create([_reservation_fields(i) for i in range(n)])]
+    paid = {'Oplacona': True, 'Status': 'Opłacona'}
+
+    plain = DatabaseTable('Rezerwacje')
+    start = time.perf_counter()
+    for record_id in ids:
+        plain.update(record_id, paid, return_record=False)
+    old = _report("update() - commit na każdy zapis", n, time.perf_counter() - start)
+
+    behind = DatabaseTable('Rezerwacje', write_behind=True)
+    start = time.perf_counter()
+    for record_id in ids:
+        behind.update(record_id, {'Status': 'Zakończona'})
+    behind.flush()
+    new = _report("update() write-behind + flush()", n, time.perf_counter() - start)
+    database.close_writers()
+    assert all(r['fields']['Status'] == 'Zakończona' for r in plain.all())
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+# ------------------------------------------------------------
+# Limit godzin tygodniowo: zapytanie SQL vs liczenie w Pythonie
+# ------------------------------------------------------------
+
+def bench_limit(tutors=20, per_tutor=3000, checks=2000):
+    from datetime import timedelta
+    import database_availability
+    print(f"\n== LimitGodzinTygodniowo: {tutors} korepetytorów x {per_tutor} rezerwacji ==")
+    _fresh_database()
+    DatabaseTable('Korepetytorzy').batch_create([
+        {'TutorID': f"tutor{i}", 'ImieNazwisko': f"Korepetytor {i}", 'LimitGodzinTygodniowo': 40}
+        for i in range(tutors)
+    ])
+    first_day = datetime.date(2024, 1, 1)
+    DatabaseTable('Rezerwacje').batch_create([
+        {'Klient': f"psid{j % 500}", 'Korepetytor': f"Korepetytor {i}",
+         'Data': (first_day + timedelta(days=j % 1000)).isoformat(), 'Godzina': f"{8 + j % 12}:00",
+         'Status': 'Anulowana' if j % 10 == 0 else 'Opłacona'}
+        for i in range(tutors) for j in range(per_tutor)
+    ])
+    DatabaseTable('StaleRezerwacje').batch_create([
+        {'Klient_ID': f"psid{i}", 'Korepetytor': f"Korepetytor {i}", 'DzienTygodnia': 'Środa',
+         'Godzina': '17:00', 'Aktywna': True}
+        for i in range(tutors)
+    ])
+    probes = [(f"Korepetytor {k % tutors}", first_day + timedelta(days=(k * 37) % 1000)) for k in range(checks)]
+    reservations = DatabaseTable('Rezerwacje')
+    recurring = DatabaseTable('StaleRezerwacje')
+
+    def python_load(tutor_name, day):
+        # Dawne podejście: wszystkie rezerwacje korepetytora do Pythona i liczenie w pętli
+        week_start = day - timedelta(days=day.weekday())
+        week_end = week_start + timedelta(days=7)
+        lessons = 0
+        for record in reservations.all(f"{{Korepetytor}} = '{tutor_name}'"):
+            fields = record['fields']
+            if fields.get('Status') in database_availability.INACTIVE_RESERVATION_STATUSES:
+                continue
+            if week_start.isoformat() <= fields['Data'] < week_end.isoformat():
+                lessons += 1
+        lessons += len(recurring.all(f"AND({{Korepetytor}} = '{tutor_name}', {{Aktywna}} = 1)"))
+        return lessons * database_availability.LESSON_MINUTES
+
+    sample = probes[:checks // 20]
+    start = time.perf_counter()
+    expected = [python_load(name, day) for name, day in sample]
+    old = _report("all() + liczenie w Pythonie", len(sample), time.perf_counter() - start)
+    start = time.perf_counter()
+    with database.pooled_connection() as conn:
+        got = [database_availability.weekly_load(conn, name, day)[1] for name, day in probes]
+    new = _report("weekly_load() - jedno zapytanie SQL", len(probes), time.perf_counter() - start)
+    assert got[:len(sample)] == expected, "weekly_load() liczy inaczej niż pętla w Pythonie"
+    print(f"   przyspieszenie: x{new / old:.1f}")
+
+    start = time.perf_counter()
+    booked = 0
+    for k in range(500):
+        try:
+            database_availability.book_reservation({
+                'Klient': 'psid1', 'Korepetytor': f"Korepetytor {k % tutors}",
+                'Data': (first_day + timedelta(days=k % 7)).isoformat(), 'Godzina': '21:00'})
+            booked += 1
+        except database_availability.WeeklyLimitExceeded:
+            pass
+    _report(f"book_reservation() ({booked} przyjętych)", 500, time.perf_counter() - start)
+
+# ------------------------------------------------------------
+# Profile PRAGMA (database_pragmas.py): durable / balanced / fast
+# ------------------------------------------------------------
+
+def bench_profiles(n=3000, rows=50000, reads=20000):
+    import random
+    import database_pragmas
+    print(f"\n== Profile wydajności SQLite ({rows} rezerwacji w bazie) ==")
+    original = database_pragmas.DEFAULT_PROFILE
+    results = {}
+    try:
+        for profile in database_pragmas.PROFILES:
+            print(f"  -- {profile}")
+            database_pragmas.DEFAULT_PROFILE = profile
+            _fresh_database()
+            reservations = DatabaseTable('Rezerwacje')
+            reservations.batch_create([_reservation_fields(i) for i in range(rows)])
+            rng = random.Random(3)
+            rates = {}
+
+            start = time.perf_counter()
+            created = [reservations.create(_reservation_fields(i), return_record=False) for i in range(n)]
+            rates['insert'] = _report("create() - commit na każdy zapis", len(created), time.perf_counter() - start)
+
+            ids = [str(rng.randint(1, rows)) for _ in range(n)]
+            start = time.perf_counter()
+            for record_id in ids:
+                reservations.update(record_id, {'Status': 'Opłacona'}, return_record=False)
+            rates['update'] = _report("update() - commit na każdy zapis", n, time.perf_counter() - start)
+
+            ids = [str(rng.randint(1, rows)) for _ in range(reads)]
+            start = time.perf_counter()
+            for record_id in ids:
+                reservations.get(record_id)
+            rates['read'] = _report("get() po id", reads, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for week in range(50):
+                reservations.all(f"AND({{Korepetytor}} = 'Korepetytor {week}', IS_AFTER({{Data}}, '2025-06-01'))")
+            rates['scan'] = _report("all() - zakres dat korepetytora", 50, time.perf_counter() - start)
+            results[profile] = rates
+    finally:
+        database_pragmas.DEFAULT_PROFILE = original
+        database.close_pools()
+
+    baseline = results['durable']
+    print("  -- względem 'durable'")
+    for profile, rates in results.items():
+        ratios = ', '.join(f"{name} x{rate / baseline[name]:.2f}" for name, rate in rates.items())
+        print(f"   {profile:<10} {ratios}")
+
+# ------------------------------------------------------------
+# Zwarte rekordy (compact=True) vs format Airtable: pamięć i czas
+# ------------------------------------------------------------
+
+def bench_compact(n=100000):
+    import tracemalloc
+    print(f"\n== Pamięć wyników all() dla {n} rezerwacji ==")
+    _fresh_database()
+    DatabaseTable('Rezerwacje').batch_create([_reservation_fields(i) for i in range(n)])
+    measured = {}
+    for label, table in (("format Airtable {'id', 'fields'}", DatabaseTable('Rezerwacje')),
+                         ("compact=True (CompactRecord)", DatabaseTable('Rezerwacje', compact=True))):
+        table.all("{Klient} = 'brak'") # rozgrzanie: pula, plan kolumn, klasa rekordu
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = table.all()
+        seconds = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert len(records) == n
+        measured[label] = size
+        _report(label, n, seconds)
+        print(f"   {'':<45} pamięć: {size / 2 ** 20:8.1f} MiB na {n} wierszy ({size / n:.0f} B/wiersz)")
+        del records
+        gc.collect()
+    old, new = measured.values()
+    print(f"   oszczędność pamięci: x{old / new:.1f}")
+
+# ------------------------------------------------------------
+# Nadchodzące lekcje: start_ts po indeksie vs filtr Data/Godzina w Pythonie
+# ------------------------------------------------------------
+
+def bench_upcoming(n=100000, queries=200):
+    from datetime import timedelta
+    print(f"\n== Lekcje w najbliższych 24 h wśród {n} rezerwacji ==")
+    _fresh_database()
+    first_day = datetime.date(2024, 1, 1)
+    DatabaseTable('Rezerwacje').batch_create([
+        {'Klient': f"psid{i % 500}", 'Korepetytor': f"Korepetytor {i % 50}",
+         'Data': (first_day + timedelta(days=i % 1000)).isoformat(), 'Godzina': f"{8 + i % 12}:{(i * 15) % 60:02d}"}
+        for i in range(n)
+    ])
+    reservations = DatabaseTable('Rezerwacje')
+    moments = [datetime.datetime(2024, 1, 1, 12) + timedelta(hours=7 * k) for k in range(queries)]
+
+    def python_upcoming(now):
+        # Dawne podejście: wszystkie rezerwacje do Pythona i parsowanie Data + Godzina
+        end = now + timedelta(hours=24)
+        found = []
+        for record in reservations.all():
+            fields = record['fields']
+            start = datetime.datetime.strptime(f"{fields['Data']} {fields['Godzina']}", '%Y-%m-%d %H:%M')
+            if now <= start < end:
+                found.append((start, int(record['id'])))
+        return [str(record_id) for _, record_id in sorted(found)]
+
+    sample = moments[:max(1, queries // 50)]
+    start = time.perf_counter()
+    expected = [python_upcoming(now) for now in sample]
+    old = _report("all() + filtr Data/Godzina w Pythonie", len(sample), time.perf_counter() - start)
+    start = time.perf_counter()
+    got = [[record['id'] for record in reservations.upcoming(hours=24, now=now)] for now in moments]
+    new = _report("upcoming(hours=24) - zakres po start_ts", len(moments), time.perf_counter() - start)
+    assert got[:len(sample)] == expected, "upcoming() zwraca inne lekcje niż filtr w Pythonie"
+    print(f"   przyspieszenie: x{new / old:.0f}")
+
+BENCHMARKS = {
+    'pool': bench_pool,
+    'batch': bench_batch,
+    'codec': bench_codec,
+    'slots': bench_slots,
+    'writers': bench_writers,
+    'write_behind': bench_write_behind,
+    'limit': bench_limit,
+    'profiles': bench_profiles,
+    'compact': bench_compact,
+    'upcoming': bench_upcoming,
+}
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    try:
+        for name in selected:
+            BENCHMARKS[name]()
+    finally:
+        database.close_pools()
+        database.close_writers()
+        for tmp_dir in _temp_dirs:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,90 @@
+"""
+Testy kompilatora formuł (database_formula.py) - bez bazy danych.
+Uruchom: python -m pytest tests/test_database_formula.py
+"""
+import os
+import sys
+
+import pytest
+
+# Dodaj katalog główny repozytorium do sys.path, aby zaimportować database_formula.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database_formula import compile_formula, local_timestamp, FormulaError
+
+def test_empty_formula_matches_everything():
+    assert compile_formula(None) == ("1=1", ())
+    assert compile_formula("   ") == ("1=1", ())
+
+def test_field_comparisons():
+    assert compile_formula("{ClientID} = 'psid1'") == ('"ClientID" = ?', ('psid1',))
+    assert compile_formula("{Status} <> 'Anulowana'") == ('"Status" != ?', ('Anulowana',))
+    assert compile_formula("{wolna_kwota} >= 1.5") == ('"wolna_kwota" >= ?', (1.5,))
+
+def test_integers_are_inlined_for_partial_indexes():
+    assert compile_formula("{Aktywna} = 1") == ('"Aktywna" = 1', ())
+
+def test_and_or_not():
+    sql, params = compile_formula("AND({Korepetytor} = 'Jan', OR({Status} = 'A', NOT({Oplacona} = 1)))")
+    assert sql == '("Korepetytor" = ? AND ("Status" = ? OR NOT ("Oplacona" = 1)))'
+    assert params == ('Jan', 'A')
+
+def test_is_after_and_is_before():
+    assert compile_formula("IS_AFTER({Data}, '2025-06-01')") == ('"Data" > ?', ('2025-06-01',))
+    assert compile_formula("IS_BEFORE({Data}, '2025-06-08')") == ('"Data" < ?', ('2025-06-08',))
+
+def test_datetime_format_native_keeps_bare_column():
+    assert compile_formula("DATETIME_FORMAT({Data}, 'YYYY-MM-DD') = '2025-06-01'") == ('"Data" = ?', ('2025-06-01',))
+    assert compile_formula("DATETIME_PARSE('2025-06-01')") == ('?', ('2025-06-01',))
+
+def test_datetime_format_non_native_uses_strftime():
+    sql, params = compile_formula("DATETIME_FORMAT({Data}, 'DD.MM.YYYY') = '01.06.2025'")
+    assert sql == 'strftime(?, "Data") = ?'
+    assert params == ('%d.%m.%Y', '01.06.2025')
+
+def test_blank():
+    assert compile_formula("{Email} = BLANK()") == ('("Email" IS NULL OR "Email" = \'\')', ())
+    assert compile_formula("BLANK() != {Email}") == ('("Email" IS NOT NULL AND "Email" != \'\')', ())
+
+def test_escaped_quotes_in_strings():
+    assert compile_formula("{Nazwisko} = 'O\\'Brien'") == ('"Nazwisko" = ?', ("O'Brien",))
+    assert compile_formula('{Nazwisko} = "a \\"b\\""') == ('"Nazwisko" = ?', ('a "b"',))
+
+def test_start_ts_compares_as_unix_time():
+    sql, params = compile_formula("AND(IS_AFTER({start_ts}, '2025-06-01 12:00'), IS_BEFORE({start_ts}, '2025-06-02'))")
+    assert sql == '("start_ts" > ? AND "start_ts" < ?)'
+    assert params == (local_timestamp('2025-06-01', '12:00'), local_timestamp('2025-06-02'))
+    # Czas Europe/Warsaw: czerwiec to UTC+2
+    assert params[0] == 1748772000
+    assert compile_formula("'2025-06-02' > {start_ts}") == ('? > "start_ts"', (local_timestamp('2025-06-02'),))
+    assert compile_formula("{start_ts} >= 1748772000") == ('"start_ts" >= 1748772000', ())
+
+def test_local_timestamp_handles_time_changes_and_garbage():
+    assert local_timestamp('2025-01-15', '9:00') - local_timestamp('2025-01-15') == 9 * 3600
+    assert local_timestamp('2025-03-30', '12:00') - local_timestamp('2025-03-29', '12:00') == 23 * 3600
+    assert local_timestamp('zle') is None
+    assert local_timestamp('2025-06-01', '25:00') is None
+
+@pytest.mark.parametrize('formula', [
+    "TODAY()",
+    "IS_AFTER({Data}, NOW())",
+    "{Data} = ",
+    "AND()",
+    "NOT({A} = 1, {B} = 2)",
+    "{A} = 1 {B}",
+    "{A} = BLANK() = 1",
+    "BLANK()",
+    "BLANK() = BLANK()",
+    "{A} > BLANK()",
+    "AND({A} = 1, BLANK())",
+    "DATETIME_FORMAT({Data}, {Format})",
+    "DATETIME_PARSE({Data}, 'DD.MM.YYYY')",
+    "IS_AFTER({start_ts}, 'jutro')",
+    "{A} = 'tekst' ~",
+])
+def test_unsupported_formulas_raise(formula):
+    with pytest.raises(FormulaError):
+        compile_formula(formula)
+
+def test_formula_error_is_value_error():
+    assert issubclass(FormulaError, ValueError)
@@ -0,0 +1,192 @@
+"""
+Testy ścieżki zapisu DatabaseTable (wątek zapisujący) na tymczasowej bazie.
+Uruchom: python -m pytest tests/test_database_writes.py
+"""
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+# Dodaj katalog główny repozytorium do sys.path, aby zaimportować database.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import database
+from database import DatabaseTable, DatabaseWriter
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'test.db')
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    database.init_database()
+    yield path
+    database.close_writers()
+    database.close_pools()
+
+@pytest.fixture
+def writer(db_path):
+    writer = DatabaseWriter(db_path)
+    yield writer
+    writer.close(timeout=5)
+
+def _insert_client(client_id):
+    def job(conn):
+        cursor = conn.execute("INSERT INTO Klienci (ClientID) VALUES (?)", (client_id,))
+        return cursor.lastrowid, None
+    return job
+
+def _client_ids(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT ClientID FROM Klienci"))
+    finally:
+        conn.close()
+
+def test_submit_returns_future_with_result(writer, db_path):
+    future = writer.submit(_insert_client('a'))
+    assert future.result(timeout=5) == 1
+    assert _client_ids(db_path) == ['a']
+
+def test_submit_propagates_job_error(writer, db_path):
+    writer.submit(_insert_client('a')).result(timeout=5)
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.submit(_insert_client('a')).result(timeout=5)
+    assert _client_ids(db_path) == ['a']
+
+def test_concurrent_serialized_writes(db_path):
+    table = DatabaseTable('Klienci', serialized_writes=True)
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(10):
+                table.create({'ClientID': f'w{n}-{i}'})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert table.count() == 80
+
+def test_group_commit_isolates_failing_job(writer, db_path):
+    # Pierwsze zadanie blokuje wątek, aż kolejne trafią do kolejki - wtedy idą jedną grupą
+    started, release = threading.Event(), threading.Event()
+    statements = []
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+        conn.set_trace_callback(statements.append)
+        return None, None
+
+    def failing(conn):
+        conn.execute("INSERT INTO Klienci (ClientID) VALUES ('b')")
+        raise RuntimeError("błąd zadania")
+
+    writer.submit(blocker)
+    assert started.wait(5)
+    futures = [writer.submit(_insert_client('a')), writer.submit(failing), writer.submit(_insert_client('c'))]
+    release.set()
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) is not None
+    group = list(statements)
+    writer.submit(lambda conn: (conn.set_trace_callback(None), None)).result(timeout=5)
+
+    # Wiersz z nieudanego zadania cofnięty do jego SAVEPOINT, pozostałe zatwierdzone
+    assert _client_ids(db_path) == ['a', 'c']
+    assert group.count('SAVEPOINT write_job') == 3
+    assert group.count('ROLLBACK TO write_job') == 1
+    # Po grupie blokera jedna transakcja obejmuje wszystkie trzy zadania
+    assert group.count('BEGIN IMMEDIATE') == 1
+    assert group.count('COMMIT') == 2
+
+def test_flush_raises_failed_deferred_write_once(db_path):
+    table = DatabaseTable('Klienci', write_behind=True)
+    assert table.create({'ClientID': 'a'}) is None
+    table.create({'ClientID': 'a'})
+    table.create({'ClientID': 'b'})
+    with pytest.raises(sqlite3.IntegrityError):
+        table.flush()
+    # Błąd zgłaszany raz; udane zapisy z tej samej serii są w bazie
+    table.flush()
+    assert _client_ids(db_path) == ['a', 'b']
+
+def test_close_discard_pending_cancels_queued_jobs(writer, db_path):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        release.wait(5)
+        return None, None
+
+    running = writer.submit(blocker)
+    assert started.wait(5)
+    queued = [writer.submit(_insert_client(f'q{i}'), deferred=True) for i in range(3)]
+    # close() opróżnia kolejkę od razu, a potem czeka na wątek - blokera zwalniamy z opóźnieniem
+    threading.Timer(0.1, release.set).start()
+    writer.close(timeout=5, discard_pending=True)
+    assert running.done() and not running.cancelled()
+    assert all(future.cancelled() for future in queued)
+    assert _client_ids(db_path) == []
+
+@pytest.fixture
+def write_events():
+    events = []
+
+    def listener(action, record_ids, field_names):
+        events.append((action, sorted(record_ids), set(field_names)))
+    database.add_write_listener('Klienci', listener)
+    yield events
+    database.remove_write_listener('Klienci', listener)
+
+def test_upsert_creates_then_updates(db_path, write_events):
+    table = DatabaseTable('Klienci')
+    created = table.upsert('ClientID', {'ClientID': 'a', 'Imie': 'Jan'})
+    updated = table.upsert('ClientID', {'ClientID': 'a', 'Imie': 'Anna'})
+    assert updated['id'] == created['id']
+    assert updated['fields']['Imie'] == 'Anna'
+    assert table.count() == 1
+    assert write_events == [('create', [created['id']], {'ClientID', 'Imie'}),
+                            ('update', [created['id']], {'Imie'})]
+
+def test_batch_upsert_splits_created_and_updated(db_path, write_events):
+    table = DatabaseTable('Klienci')
+    existing = table.create({'ClientID': 'a', 'Imie': 'Jan'})
+    write_events.clear()
+    records = table.batch_upsert('ClientID', [{'ClientID': 'b', 'Imie': 'Ewa'}, {'ClientID': 'a', 'Imie': 'Anna'}])
+    assert [r['fields']['ClientID'] for r in records] == ['b', 'a']
+    assert records[1]['id'] == existing['id']
+    assert write_events == [('create', [records[0]['id']], {'ClientID', 'Imie'}),
+                            ('update', [existing['id']], {'Imie'})]
+
+def test_upsert_ignore_reads_back_existing_record(db_path, write_events):
+    table = DatabaseTable('Klienci')
+    existing = table.create({'ClientID': 'a', 'Imie': 'Jan'})
+    write_events.clear()
+    # DO NOTHING nie zwraca istniejących wierszy przez RETURNING - rekord dobierany osobnym SELECT
+    records = table.batch_upsert('ClientID', [{'ClientID': 'a', 'Imie': 'Anna'}, {'ClientID': 'b', 'Imie': 'Ewa'}],
+                                 on_conflict='ignore')
+    assert records[0]['id'] == existing['id']
+    assert records[0]['fields']['Imie'] == 'Jan'
+    assert records[1]['fields']['Imie'] == 'Ewa'
+    assert write_events == [('create', [records[1]['id']], {'ClientID', 'Imie'})]
+
+def test_upsert_rejects_bad_arguments(db_path):
+    table = DatabaseTable('Klienci')
+    with pytest.raises(ValueError):
+        table.upsert('ClientID', {'ClientID': 'a'}, on_conflict='replace')
+    with pytest.raises(ValueError):
+        table.batch_upsert('ClientID', [{'ClientID': 'a'}, {'Imie': 'Jan'}])
+
+def test_batch_create_with_explicit_ids(db_path):
+    table = DatabaseTable('Klienci')
+    records = table.batch_create([{'id': 100, 'ClientID': 'a'}, {'id': 50, 'ClientID': 'b'},
+                                  {'ClientID': 'c'}, {'ClientID': 'd'}])
+    assert [(r['id'], r['fields']['ClientID']) for r in records] == [('100', 'a'), ('50', 'b'), ('101', 'c'), ('102', 'd')]